@@ -1,36 +1,39 @@
 import socket
+import os
+import sys
+
+# Shared streaming reader lives in the project root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ntrip_stream import SourcetableParser, iter_sourcetable
 
 HOST = "www.smartfix.co.nz"
 PORT = 2101
 
 def get_sourcetable():
+    """Returns the list of STR records (read as they arrive, stops at ENDSOURCETABLE)."""
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.settimeout(10)
         s.connect((HOST, PORT))
         s.sendall(b"GET / HTTP/1.0\r\nUser-Agent: NTRIP check\r\n\r\n")
         
-        response = b""
-        while True:
-            chunk = s.recv(4096)
-            if not chunk:
-                break
-            response += chunk
+        parser = SourcetableParser()
+        records = list(iter_sourcetable(s, parser))
         s.close()
-        return response.decode('utf-8', 'ignore')
+        print(f"Response: {parser.status_line}")
+        return records
     except Exception as e:
         print(f"Error: {e}")
-        return ""
+        return []
 
-data = get_sourcetable()
-print(f"Downloaded {len(data)} bytes.")
+str_lines = get_sourcetable()
+print(f"Downloaded {len(str_lines)} STR records.")
 
 # Search for patterns
-if "SingleSiteADV" in data:
+found = [l for l in str_lines if "SingleSiteADV" in l]
+if found:
     print("FOUND 'SingleSiteADV' in sourcetable!")
     # Print some examples
-    lines = data.split('\n')
-    found = [l for l in lines if "SingleSiteADV" in l]
     print("Examples:")
     for l in found[:5]:
         print(l)
@@ -38,8 +41,6 @@ else:
     print("Did NOT find 'SingleSiteADV' in sourcetable.")
     
     # Print some regular stations to see format
-    lines = data.split('\n')
-    str_lines = [l for l in lines if l.startswith("STR")]
     print("Standard Examples:")
     for l in str_lines[:5]:
         print(l)
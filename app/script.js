@@ -146,6 +146,7 @@ setTimeout(() => {
 // --- Data Containers ---
 let allStations = []; // To store station data for nearest calculation
 let authoritativePorts = {}; // key: station_code, value: port
+let portTable = null; // compiled overrides + latitude bands (export_port_regions.py)
 let stationMetaData = {}; // Store station metadata globally
 let circuitData = null; // Store circuit GeoJSON data globally
 
@@ -161,6 +162,121 @@ let measureTooltip = null;
 // --- Cache Buster ---
 const cb = new Date().getTime();
 
+// --- Station Status Feed (status_feed.py) ---
+// Cached versioned snapshot in localStorage; only the small delta file is fetched
+// when the cache is recent enough. Falls back to the full snapshot / station_meta.json.
+const STATUS_CACHE_KEY = 'sbcStatusSnapshot';
+const STATUS_POLL_MS = 5 * 60 * 1000;
+
+function applyStatusDeltas(snapshot, feed) {
+    // Returns the updated snapshot, or null if the feed can't bring it up to date
+    if (!feed || !Array.isArray(feed.deltas)) return null;
+    if (feed.version === snapshot.version) return snapshot;
+    const newer = feed.deltas.filter(d => d.version > snapshot.version);
+    if (!newer.length || newer[0].base_version !== snapshot.version) return null;
+    newer.forEach(d => {
+        Object.assign(snapshot.stations, d.changed);
+        d.removed.forEach(code => delete snapshot.stations[code]);
+        snapshot.version = d.version;
+        snapshot.generated = d.generated;
+    });
+    return snapshot;
+}
+
+function saveStatusSnapshot(snapshot) {
+    try { localStorage.setItem(STATUS_CACHE_KEY, JSON.stringify(snapshot)); } catch (e) { }
+}
+
+function loadStationStatus() {
+    let cached = null;
+    try { cached = JSON.parse(localStorage.getItem(STATUS_CACHE_KEY)); } catch (e) { }
+
+    const fetchSnapshot = () => fetch(`./data/status_snapshot.json?v=${cb}`)
+        .then(res => res.json())
+        .then(snapshot => { saveStatusSnapshot(snapshot); return snapshot.stations; })
+        .catch(e => fetch(`./data/station_meta.json?v=${cb}`).then(res => res.json())); // No feed yet
+
+    if (!cached || !cached.version) return fetchSnapshot();
+    return fetch(`./data/status_delta.json?v=${cb}`)
+        .then(res => res.json())
+        .then(feed => {
+            const updated = applyStatusDeltas(cached, feed);
+            if (!updated) return fetchSnapshot();
+            saveStatusSnapshot(updated);
+            return updated.stations;
+        })
+        .catch(e => fetchSnapshot());
+}
+
+function readStatusCache() {
+    try { return JSON.parse(localStorage.getItem(STATUS_CACHE_KEY)); } catch (e) { return null; }
+}
+
+function applyStatusFeed(feed) {
+    // Applies a delta feed to the cached snapshot and recolours changed markers; false if it didn't fit
+    const cached = readStatusCache();
+    if (!cached || !cached.version) return false;
+    const before = cached.version;
+    const updated = applyStatusDeltas(cached, feed);
+    if (!updated) return false;
+    if (updated.version === before) return true;
+    saveStatusSnapshot(updated);
+    Object.assign(stationMetaData, updated.stations);
+    recolorStationMarkers();
+    return true;
+}
+
+function recolorStationMarkers() {
+    stationLayer.eachLayer(function (marker) {
+        const data = marker.stationCode ? stationMetaData[marker.stationCode] : null;
+        if (!data) return;
+        marker.isOffline = data.status === 'Offline';
+        marker.setStyle({ fillColor: stationColor(data.status, data) });
+    });
+    updateStationLabels();
+}
+
+function pollStatusDelta() {
+    fetch(`./data/status_delta.json?v=${new Date().getTime()}`)
+        .then(res => res.json())
+        .then(feed => applyStatusFeed(feed))
+        .catch(e => console.warn('Status delta poll failed:', e));
+}
+
+function resyncStatus() {
+    // Too far behind for deltas: take the full snapshot
+    fetch(`./data/status_snapshot.json?v=${new Date().getTime()}`)
+        .then(res => res.json())
+        .then(snapshot => {
+            saveStatusSnapshot(snapshot);
+            Object.assign(stationMetaData, snapshot.stations);
+            recolorStationMarkers();
+        })
+        .catch(e => console.warn('Status resync failed:', e));
+}
+
+// Live push from the local server (app/serve.py /events). On static hosting the
+// endpoint doesn't exist and EventSource gives up; the periodic poll still runs.
+function subscribeStatusEvents() {
+    if (!window.EventSource) return;
+    const source = new EventSource('./events');
+    source.addEventListener('delta', e => {
+        const delta = JSON.parse(e.data);
+        if (!applyStatusFeed({ version: delta.version, deltas: [delta] })) resyncStatus();
+    });
+    source.addEventListener('resync', () => resyncStatus());
+}
+
+function stationColor(status, data) {
+    if (status === 'Offline') return '#dc3545'; // Red for Offline
+    if (data && data.sats_tracked === 0) return '#fd7e14'; // Orange for Online / 0 satellites
+    if (status === 'Degraded') return '#ffc107'; // Yellow for Degraded (flapping)
+    return '#28a745'; // Green for Online (both SmartFix and LINZ)
+}
+
+setInterval(pollStatusDelta, STATUS_POLL_MS);
+subscribeStatusEvents();
+
 // --- Colors ---
 const portColors = {
     4809: '#9b59b6', // Auckland/Northland - Purple
@@ -313,11 +429,14 @@ Promise.all([
     fetch(`./data/Sites_20250725_Global.geojson?v=${cb}`).then(res => res.json()), // SmartFix
     fetch(`./data/Sites_20250725_LINZ.geojson?v=${cb}`).then(res => res.json()), // LINZ
     fetch(`./data/station_port_mapping.json?v=${cb}`).then(res => res.json()).catch(e => null), // Authoritative Ports
-    fetch(`./data/station_meta.json?v=${cb}`).then(res => res.json()).catch(e => ({})), // Station Meta (Status + Ports)
+    loadStationStatus().catch(e => ({})), // Station Status (cached snapshot + delta feed)
+    fetch(`./data/station_uptime.json?v=${cb}`).then(res => res.json()).catch(e => ({})), // Rolling availability (status_history.py)
+    fetch(`./data/port_assignment.json?v=${cb}`).then(res => res.json()).catch(e => null), // Same port table as the regions
 ])
-    .then(([portRegions, smartfixData, linzData, portMapping, stationMeta]) => {
+    .then(([portRegions, smartfixData, linzData, portMapping, stationMeta, uptimeSummary, portAssignment]) => {
         // Init authoritative ports and metadata
         authoritativePorts = portMapping || {};
+        portTable = portAssignment;
         stationMetaData = stationMeta || {}; // Store globally
         const metaData = stationMetaData;
         const EXCLUDED = ["TREC", "trec", "2GRO", "2GR0", "1778", "7651", "xGRX", "xgrx"];
@@ -438,9 +557,14 @@ Promise.all([
 
                     // (Status already determined above)
 
+                    // Online but tracking nothing (deep health check saw 0 satellites in the MSM stream)
+                    const isBlind = !isOffline && metaData[code] && metaData[code].sats_tracked === 0;
+                    // Flapping between Online/Offline (station_state.py hysteresis)
+                    const isDegraded = status === 'Degraded';
+                    const flaps = metaData[code] ? (metaData[code].flaps || 0) : 0;
+
                     // Color Logic
-                    let color = '#28a745'; // Green for Online (both SmartFix and LINZ)
-                    if (isOffline) color = '#dc3545'; // Red for Offline
+                    const color = stationColor(status, metaData[code]);
 
                     const marker = L.circleMarker([lat, lon], {
                         radius: 8, // Slightly smaller for cleaner look
@@ -458,14 +582,20 @@ Promise.all([
                     // Restore missing definitions
                     const networkPort = (metaData[code] && metaData[code].network_port) ? metaData[code].network_port : 'No';
                     const regionName = portNames[port] || 'Unknown';
+                    const uptime = (uptimeSummary.stations || {})[code];
+                    const fmtUptime = (v) => (v === null || v === undefined) ? '-' : `${v}%`;
+                    const uptimeLine = uptime ? `Uptime: 24h <b>${fmtUptime(uptime['24h'])}</b> · 7d <b>${fmtUptime(uptime['7d'])}</b> · 30d <b>${fmtUptime(uptime['30d'])}</b><br>` : '';
 
                     const popupContent = `
                         <div style="font-family: Roboto, sans-serif; font-size: 13px;">
                             <b style="font-size: 14px;">${code}</b><br>
-                            Status: <b style="color: ${isOffline ? 'red' : 'green'}">${status}</b><br>
+                            Status: <b style="color: ${isOffline ? 'red' : (isDegraded ? '#d39e00' : 'green')}">${status}</b><br>
+                            ${flaps ? `Flaps (recent checks): <b>${flaps}</b><br>` : ''}
+                            ${isBlind ? '<b style="color: #fd7e14;">Tracking 0 satellites</b><br>' : ''}
                             Location: <b>${locationName}</b><br>
                             Single Site Port: <b>${port}</b><br>
                             Network Port: <b>${networkPort}</b><br>
+                            ${uptimeLine}
                             Region: ${regionName}
                         </div>
                     `;
@@ -1281,6 +1411,16 @@ function findNearestStation(lat, lon, returnInfo = false) {
 
 // Helper: Determine Authoritative Port for Station
 function getPortForStation(code, lat) {
+    // Port table compiled by export_port_regions.py (same as the regions)
+    if (portTable) {
+        if (portTable.overrides[code]) return portTable.overrides[code];
+        // ports[number of breakpoints below lat]
+        let band = 0;
+        while (band < portTable.breakpoints.length && portTable.breakpoints[band] < lat) band++;
+        return portTable.ports[band];
+    }
+
+    // Fallback when port_assignment.json isn't there yet
     // 0. Specific Overrides (User Request)
     if (code === 'METH' || code === 'GSCT') return 4803;
 
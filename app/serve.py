@@ -37,9 +37,10 @@ def get_all_ips():
     return ips
 
 import json
-import requests
 import sys
 
+from status_events import StatusEventHub
+
 # --- API Integration ---
 def update_station_status(token):
     if not token:
@@ -47,18 +48,19 @@ def update_station_status(token):
         return
 
     print("Fetching station status from SBC API...")
-    BASE_URL = "https://smartfix.co.nz/SBC/API"
-    HEADERS = {
-        "X-SBC-Auth": token,
-        "Accept": "application/json"
-    }
+    try:
+        # Shared API client lives in the project root (not shipped in the deployment package)
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+        from smartfix_api import SmartFixClient
+    except ImportError as e:
+        print(f"API client not available ({e}). Skipping API check.")
+        return
+
+    client = SmartFixClient("https://smartfix.co.nz/SBC/API", username=None, password=None, token=token)
     
     try:
-        response = requests.get(f"{BASE_URL}/sites", headers=HEADERS, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            sites = data['sites'] if isinstance(data, dict) and 'sites' in data else data
-            
+        sites = client.get_sites()
+        if sites is not None:
             status_map = {}
             online_count = 0
             
@@ -75,14 +77,7 @@ def update_station_status(token):
                 if status_map[code]["status"] == "Online":
                     online_count += 1
             
-            # Save to app/data/station_meta.json (overwriting or merging?)
-            # The script.js loads 'station_meta.json'. Let's see if we should merge with existing or just create new.
-            # Looking at script.js line 222, it tries to load station_meta.json.
-            # Let's write to station_status.json and update script.js to read it, OR just write to station_meta.json
-            # Currently station_meta.json might have other info?
-            # Let's assume we can overwrite or create a specific status file.
-            # To be safe, let's write to 'station_status.json' and update script.js to read it.
-            
+            # Written to 'station_status.json' (station_meta.json is owned by the status scripts)
             output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'station_status.json')
             with open(output_path, 'w') as f:
                 json.dump(status_map, f, indent=2)
@@ -90,11 +85,23 @@ def update_station_status(token):
             print(f"Successfully updated status for {len(sites)} stations ({online_count} Online).")
             print(f"Saved to {output_path}")
         else:
-            print(f"API Error: {response.status_code} - {response.text}")
+            print("API Error: Could not retrieve sites.")
     except Exception as e:
         print(f"Failed to update status: {e}")
 
+# Live status push (Server-Sent Events) for every open map
+status_hub = StatusEventHub()
+
 class Handler(http.server.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] == '/events':
+            # Hand the socket to the SSE event loop; this thread goes back to serving files
+            sock = socket.socket(fileno=self.connection.detach())
+            status_hub.attach(sock, self.headers.get('Last-Event-ID'))
+            self.close_connection = True
+            return
+        super().do_GET()
+
     def end_headers(self):
         # Prevent caching
         self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
@@ -134,8 +141,14 @@ print("  IMPORTANT: You MUST use 'http://', NOT 'https://'")
 print("  If your phone automatically switches to https, type http:// manually.")
 print("="*60 + "\n")
 
-with socketserver.TCPServer(("0.0.0.0", PORT), Handler) as httpd:
-    print(f"Serving at port {PORT}...")
+class Server(socketserver.TCPServer):
+    # Map clients open an /events connection each; don't refuse bursts of connects
+    request_queue_size = 128
+
+status_hub.start()
+
+with Server(("0.0.0.0", PORT), Handler) as httpd:
+    print(f"Serving at port {PORT}... (live status events at /events)")
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import threading
+
+# Server-Sent Events hub for live status push (used by serve.py at /events).
+#
+# All SSE connections live on one asyncio loop in a single background thread,
+# so hundreds of open map clients don't need a thread each. The hub watches
+# data/status_delta.json (written by the status pipeline, status_feed.py) and
+# pushes every new delta to all clients as an 'event: delta'.
+#
+# - Backpressure: each client has a bounded queue. A client that falls behind
+#   has its queue replaced by a single 'resync' event (refetch the snapshot)
+#   instead of slowing everyone else down; a client whose socket stops
+#   draining is disconnected.
+# - Heartbeats: a comment line every HEARTBEAT_INTERVAL keeps proxies from
+#   closing idle connections and lets us notice dead clients.
+# - Reconnects: EventSource sends Last-Event-ID (= feed version); missed
+#   deltas still in the delta file are replayed.
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DELTA_FILE = os.path.join(DATA_DIR, 'status_delta.json')
+WATCH_INTERVAL = 2 # seconds between delta file checks
+HEARTBEAT_INTERVAL = 15 # seconds
+CLIENT_QUEUE_SIZE = 32 # pending events per client before it gets a resync
+DRAIN_TIMEOUT = 10 # seconds a client may take to accept a write
+RETRY_MS = 5000 # EventSource reconnect delay
+
+SSE_HEADERS = (
+    "HTTP/1.1 200 OK\r\n"
+    "Content-Type: text/event-stream\r\n"
+    "Cache-Control: no-store\r\n"
+    "Connection: keep-alive\r\n"
+    "Access-Control-Allow-Origin: *\r\n"
+    "\r\n"
+)
+
+def format_event(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+def load_deltas():
+    """(version, deltas) from the delta file, or (0, []) if it isn't there yet."""
+    try:
+        with open(DELTA_FILE, 'r') as f:
+            feed = json.load(f)
+        return feed.get('version', 0), feed.get('deltas', [])
+    except (OSError, ValueError):
+        return 0, []
+
+class SSEClient:
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.resyncs = 0
+
+    def send(self, message):
+        """Queues without blocking; on overflow the backlog is dropped for one resync event."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(format_event({"reason": "client too slow"}, event="resync"))
+            self.resyncs += 1
+
+class StatusEventHub:
+    def __init__(self):
+        self.clients = set()
+        self.version, _ = load_deltas()
+        self.mtime = None
+        self.loop = None
+
+    def start(self):
+        """Starts the event loop thread. Returns once it's accepting clients."""
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.loop.create_task(self.watch_deltas())
+            self.loop.create_task(self.heartbeat())
+            self.loop.call_soon(ready.set)
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="sse-hub", daemon=True).start()
+        ready.wait()
+
+    def attach(self, sock, last_event_id=None):
+        """Hands a connected socket (from the HTTP handler thread) over to the loop."""
+        asyncio.run_coroutine_threadsafe(self.serve_client(sock, last_event_id), self.loop)
+
+    def broadcast(self, message):
+        for client in list(self.clients):
+            client.send(message)
+
+    async def serve_client(self, sock, last_event_id):
+        try:
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except OSError:
+            sock.close()
+            return
+
+        client = SSEClient(writer)
+        closed = None
+        try:
+            writer.write(SSE_HEADERS.encode('ascii') + f"retry: {RETRY_MS}\n\n".encode('ascii'))
+            client.send(format_event({"version": self.version}, event="hello", event_id=self.version))
+
+            # Replay what a reconnecting client missed (if still in the delta file)
+            if last_event_id and last_event_id.isdigit():
+                for delta in load_deltas()[1]:
+                    if delta['version'] > int(last_event_id):
+                        client.send(format_event(delta, event="delta", event_id=delta['version']))
+
+            self.clients.add(client)
+            closed = asyncio.ensure_future(reader.read()) # completes when the browser disconnects
+            while True:
+                message = asyncio.ensure_future(client.queue.get())
+                done, _ = await asyncio.wait({message, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    message.cancel()
+                    break
+                writer.write(message.result())
+                await asyncio.wait_for(writer.drain(), timeout=DRAIN_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            pass # disconnected / not draining
+        finally:
+            self.clients.discard(client)
+            if closed is not None:
+                closed.cancel()
+            writer.close()
+
+    async def watch_deltas(self):
+        """Pushes deltas newer than the last seen version whenever the delta file changes."""
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            try:
+                mtime = os.stat(DELTA_FILE).st_mtime
+            except OSError:
+                continue
+            if mtime == self.mtime:
+                continue
+            self.mtime = mtime
+
+            version, deltas = load_deltas()
+            for delta in deltas:
+                if delta['version'] > self.version:
+                    self.broadcast(format_event(delta, event="delta", event_id=delta['version']))
+            if version > self.version:
+                print(f"[sse] Pushed status version {version} to {len(self.clients)} clients.")
+                self.version = version
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            self.broadcast(b": ping\n\n")
@@ -0,0 +1,20 @@
+import json
+import os
+
+# Atomic file writes, shared by every script whose output is read by something
+# else (the web map, station_monitor.py, the next pipeline run): the data goes
+# to '<path>.tmp' first and os.replace() swaps it in, so a reader sees either
+# the old or the new file, never a half-written one.
+
+def write_atomic(path, data, mode=None):
+    """Writes str or bytes via temp file + rename. 'mode' (e.g. 0o600) is applied before the rename."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    if mode is not None:
+        os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+def write_json_atomic(path, data, mode=None, **kwargs):
+    """write_atomic() of json.dumps(data, **kwargs) (indent, sort_keys, separators...)."""
+    write_atomic(path, json.dumps(data, **kwargs), mode)
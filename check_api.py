@@ -1,23 +1,27 @@
-import requests
 import json
 import sys
 import os
 
+from smartfix_api import SmartFixClient
+
 # Configuration
 BASE_URL = "https://nzsmartnet.co.nz/SBC/API"
-# Use environment variable if available, otherwise fallback to hardcoded (for local testing without env vars)
-TOKEN = os.environ.get("SBC_AUTH_TOKEN", "ndeDt9iZK8xCPxglCL0KwM8kWUNQpHBCJWs0a5ZmeYrD9gvfqj9ZGSKCxFF8tmM0jctgwmCU213Csf97nfb9DNEQCuiaIfDx3Sgm8xTDxcDUxT8kRJPGD7UQQpH6UQZRBQbcVSwt286otlBSDZKpX1oEvWcIDECPZaHjAF5CUK8vaui5V7o7f7PRE2gxc6Vq4LY8dPI8sbDUvgrhIdcuIA91k4JRU42MesNHvRAds22cpuWJ3KpirJIASdRWUPrY")
-
-HEADERS = {
-    "X-SBC-Auth": TOKEN,
-    "Accept": "application/json"
-}
+# Session token from SBC_AUTH_TOKEN, or NZSMARTNET_USER/NZSMARTNET_PASSWORD to log in
+TOKEN = os.environ.get("SBC_AUTH_TOKEN")
+USER = os.environ.get("NZSMARTNET_USER")
+PASSWORD = os.environ.get("NZSMARTNET_PASSWORD")
 
 def check_sites():
+    if not TOKEN and not (USER and PASSWORD):
+        print("Error: Set SBC_AUTH_TOKEN, or NZSMARTNET_USER and NZSMARTNET_PASSWORD.")
+        sys.exit(1)
+
+    # Explicit token; with credentials set the client logs in (or re-logs in on 401)
+    client = SmartFixClient(BASE_URL, USER, PASSWORD, token=TOKEN)
     url = f"{BASE_URL}/sites"
     print(f"Checking {url}...")
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = client.get("sites")
         print(f"Status Code: {response.status_code}")
         
         if response.status_code == 200:
@@ -1,149 +1,26 @@
-import urllib.request
-import urllib.error
-import json
-import ssl
-import sys
-import os
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-# Configuration
-BASE_URL = "https://smartfix.co.nz/SBC/API/v12.0" 
-# Use Environment Variables with fallback to provided defaults
-USERNAME = os.environ.get("SMARTFIX_USER") or "Admin"
-PASSWORD = os.environ.get("SMARTFIX_PASSWORD") or "Surv3y"
+from atomic_io import write_json_atomic
+from networks import load_networks
+from smartfix_api import SmartFixClient, USERNAME, PASSWORD
+from stations import canonical_code, read_meta, registry
+from station_state import apply_sample, flapping_report
+from status_feed import publish_status_feed
+from status_history import update_history
 
 META_FILE = "app/data/station_meta.json"
 QA_FILE = "app/data/QA_Port_Assignments.txt"
 
-# Bypass SSL verification
-ctx = ssl.create_default_context()
-ctx.check_hostname = False
-ctx.verify_mode = ssl.CERT_NONE
-
-def make_request(url, method='GET', data=None, headers=None):
-    if headers is None:
-        headers = {}
-    
-    req = urllib.request.Request(url, method=method)
-    for k, v in headers.items():
-        req.add_header(k, v)
-    
-    json_data = None
-    if data:
-        json_data = json.dumps(data).encode('utf-8')
-        req.add_header('Content-Type', 'application/json')
-    
-    try:
-        with urllib.request.urlopen(req, data=json_data, context=ctx) as response:
-            content = response.read()
-            resp_headers = dict(response.info())
-            if content:
-                try:
-                    return response.status, json.loads(content), resp_headers
-                except json.JSONDecodeError:
-                    return response.status, content.decode('utf-8'), resp_headers 
-            return response.status, None, resp_headers
-    except urllib.error.HTTPError as e:
-        try:
-            err_body = e.read().decode('utf-8')
-            return e.code, json.loads(err_body), {}
-        except:
-            return e.code, str(e), {}
-    except Exception as e:
-        return 0, str(e), {}
-
-def login():
-    url = f"{BASE_URL}/login"
-    
-    # Try lowercase payload first
-    payload = {"username": USERNAME, "password": PASSWORD}
-    status, body, headers = make_request(url, 'POST', payload)
-    
-    token = None
-    if status == 200:
-        if isinstance(body, dict):
-             for k in ['token', 'sessionToken', 'id', 'accessToken']:
-                 if k in body:
-                     token = body[k]
-                     break
-                 for key in body.keys():
-                     if key.lower() == k.lower():
-                         token = body[key]
-                         break
-        elif isinstance(body, str):
-            token = body
-        
-        if not token:
-            for k, v in headers.items():
-                if k.lower() in ['x-sbc-auth', 'token', 'authorization']:
-                    token = v
-                    break
-            
-    if not token and status != 200:
-        print(f"Login failed with lowercase payload (Status {status}). Retrying legacy...")
-        # Try Capitalized payload if needed (legacy)
-        payload = {"Username": USERNAME, "Password": PASSWORD}
-        status, body, headers = make_request(url, 'POST', payload)
-        if status == 200:
-             if isinstance(body, dict):
-                 for k in ['token', 'sessionToken', 'id']:
-                     if k in body:
-                         token = body[k]
-                         break
-             elif isinstance(body, str):
-                token = body
-
-    if token:
-        return token.strip('"')
-    else:
-        print(f"Login failed. Status: {status}, Body: {body}")
-        return None
-
-def get_sites(token):
-    url = f"{BASE_URL}/sites" 
-    status, data, _ = make_request(url, 'GET', headers={'X-SBC-Auth': token})
-    
-    if status == 200 and data:
-        return data.get('sites', data) if isinstance(data, dict) else data
-    else:
-        print(f"Failed to retrieve sites (Status {status}).")
-        return None
+def get_sites(client):
+    """All sites from the API (cached token / re-login on 401 handled by the client)."""
+    return client.get_sites()
 
 def load_meta():
-    if os.path.exists(META_FILE):
-        try:
-            with open(META_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    return read_meta(META_FILE)
 
-def main():
-    print(f"Connecting to SmartFix API ({BASE_URL})...")
-    
-    token = login()
-    if not token:
-        print("CRITICAL: Failed to login to API. Aborting update.")
-        exit(1)
-        
-    print("Login successful.")
-    
-    sites = get_sites(token)
-    if not sites:
-        print("CRITICAL: No sites returned from API. Aborting update.")
-        exit(1)
-        
-    print(f"Retrieved {len(sites)} sites from API.")
-    
-    # Load existing metadata (to preserve ports)
-    station_meta = load_meta()
-    
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
-    updates_count = 0
-    online_count = 0
-    
-    # Map API sites by Code or Name for lookup
+def build_api_map(sites, network=None):
+    """{CODE: site} for every API site with a usable 4-char code (canonical codes, sites excluded on 'network' dropped)."""
     api_map = {}
     for s in sites:
         # Try to find a 4-char code
@@ -154,48 +31,60 @@ def main():
             if len(name) == 4 and name.isupper():
                 code = name
         
-        if code:
-            api_map[code.upper()] = s
+        if code and not registry().is_excluded(code, network):
+            api_map[canonical_code(code)] = s
+    return api_map
 
-    # Update metadata
-    for code, data in station_meta.items():
-        api_data = api_map.get(code)
-        
-        if api_data:
-            # Determine status
-            connected = api_data.get('connected', False)
-            receiving = api_data.get('receivingData', False)
-            
-            is_online = connected and receiving
-            new_status = "Online" if is_online else "Offline"
-            
-            # Update status
-            data['status'] = new_status
-            
-            # Update last_seen if online
-            if is_online:
-                data['last_seen'] = current_time
-                online_count += 1
-            
-            updates_count += 1
-        else:
-            if data['status'] == 'Online':
-                print(f"Warning: Station {code} not found in API. Marking Offline.")
-                data['status'] = 'Offline'
-            # If already offline, verify we have port info preserved. 
-            # (We loaded the whole meta, so it is preserved by default)
+def api_client(network):
+    """SmartFixClient for a network's API (smartfix_api defaults only where the config allows it)."""
+    if network.api_default_credentials:
+        return SmartFixClient(network.api_url, network.api_user or USERNAME, network.api_password or PASSWORD,
+                              token=network.api_token)
+    return SmartFixClient(network.api_url, network.api_user, network.api_password, token=network.api_token)
 
-    # Save metadata
-    with open(META_FILE, 'w') as f:
-        json.dump(station_meta, f, indent=4, sort_keys=True)
-    
-    print(f"Updated metadata for {updates_count} stations ({online_count} Online).")
-    print(f"Saved to {META_FILE}")
-    
-    # Generate QA Report
-    report_lines = []
-    report_lines.append(f"QA STATION STATUS REPORT ({current_time})")
-    report_lines.append(f"Source: SmartFix API")
+def fetch_network_sites(network):
+    """{CODE: site} from one network's API, or None if it's unavailable."""
+    client = api_client(network)
+    try:
+        if not client.ensure_token():
+            print(f"[api:{network.name}] Failed to login to API.")
+            return None
+        sites = get_sites(client)
+        if not sites:
+            print(f"[api:{network.name}] No sites returned from API.")
+            return None
+        print(f"[api:{network.name}] Retrieved {len(sites)} sites.")
+        return build_api_map(sites, network)
+    except Exception as e:
+        print(f"[api:{network.name}] FAILED: {e}")
+        return None
+    finally:
+        client.close()
+
+def fetch_api_maps(networks):
+    """
+    Fetches every network's API concurrently (one client + token each) and merges
+    the site maps; a code known to several networks keeps the first network's site.
+    Returns None if no network's API answered.
+    """
+    networks = [n for n in networks if n.has_api]
+    if not networks:
+        return None
+    with ThreadPoolExecutor(max_workers=len(networks)) as pool:
+        maps = list(pool.map(fetch_network_sites, networks))
+
+    api_map = {}
+    for network_map in reversed([m for m in maps if m is not None]):
+        api_map.update(network_map)
+    return api_map if any(m is not None for m in maps) else None
+
+def is_api_online(site):
+    """Online = connected to the SBC and receiving data."""
+    return site.get('connected', False) and site.get('receivingData', False)
+
+def build_qa_report(station_meta, header_lines):
+    """QA report lines: stations grouped by port, then the offline list."""
+    report_lines = list(header_lines)
     report_lines.append("="*40)
     
     # Group by Port (using existing port info)
@@ -223,6 +112,62 @@ def main():
         offline_stations.sort()
         for i in range(0, len(offline_stations), 3):
             report_lines.append(", ".join(offline_stations[i:i+3]))
+
+    report_lines.extend(flapping_report(station_meta))
+    return report_lines
+
+def main():
+    networks = load_networks()
+    print(f"Connecting to SBC APIs ({', '.join(f'{n.name}: {n.api_url}' for n in networks if n.has_api)})...")
+    
+    # Map API sites by Code or Name for lookup (all networks, fetched in parallel)
+    api_map = fetch_api_maps(networks)
+    if not api_map:
+        print("CRITICAL: No sites returned from any API. Aborting update.")
+        exit(1)
+        
+    print(f"Retrieved {len(api_map)} sites from API.")
+    
+    # Load existing metadata (to preserve ports)
+    station_meta = load_meta()
+    
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+    updates_count = 0
+    online_count = 0
+
+    # Update metadata
+    for code, data in station_meta.items():
+        api_data = api_map.get(code)
+        
+        if api_data:
+            # Determine status (hysteresis / flap detection in station_state.py)
+            is_online = is_api_online(api_data)
+            new_status = apply_sample(data, is_online, current_time)
+            
+            if new_status == 'Online':
+                online_count += 1
+            
+            updates_count += 1
+        else:
+            if data['status'] != 'Offline':
+                print(f"Warning: Station {code} not found in API. Counting as an offline sample.")
+                apply_sample(data, False, current_time)
+            # If already offline, verify we have port info preserved. 
+            # (We loaded the whole meta, so it is preserved by default)
+
+    # Save metadata
+    write_json_atomic(META_FILE, station_meta, indent=4, sort_keys=True)
+    publish_status_feed(station_meta)
+    
+    print(f"Updated metadata for {updates_count} stations ({online_count} Online).")
+    print(f"Saved to {META_FILE}")
+    update_history(station_meta, "api")
+    
+    # Generate QA Report
+    report_lines = build_qa_report(station_meta, [
+        f"QA STATION STATUS REPORT ({current_time})",
+        f"Source: SmartFix API",
+    ])
             
     with open(QA_FILE, 'w') as f:
         f.write("\n".join(report_lines))
@@ -1,36 +1,51 @@
 import socket
-import json
 import base64
 import time
+import asyncio
 
 import os
 # ... (imports already there)
+from atomic_io import write_atomic, write_json_atomic
+from networks import load_networks
+from ntrip_stream import SourcetableParser, iter_sourcetable, read_sourcetable_async
+from status_feed import publish_status_feed
+from stations import canonical_code, registry, GLOBAL_GEOJSON
+from station_state import apply_sample
+from status_history import update_history
 
-EXCLUDED_STATIONS = ["TREC", "trec", "2GRO", "2GR0", "1778", "7651", "xGRX", "xgrx", "GSMG", "gsmg"]
-
-HOST = "www.smartfix.co.nz"
-# Check ports 4800 to 4815 (inclusive)
-PORTS = list(range(4800, 4816))
-USER = os.environ.get("NTRIP_USER")
-PASSWORD = os.environ.get("NTRIP_PASSWORD")
+# Casters, ports, credentials and concurrency limits per network live in
+# networks.json (see networks.py); codes and exclusions go through stations.py
 OUTPUT_FILE = "app/data/station_port_mapping.json"
+META_FILE = "app/data/station_meta.json"
 
-def load_known_stations(geojson_path):
-    """Loads all known station codes from the GeoJSON file."""
-    if not os.path.exists(geojson_path):
-        print(f"Warning: GeoJSON not found at {geojson_path}")
-        return set()
-    
-    with open(geojson_path, 'r') as f:
-        data = json.load(f)
-    
-    codes = set()
-    for feature in data.get('features', []):
-        props = feature.get('properties', {})
-        code = props.get('Site Code')
-        if code:
-            codes.add(code)
-    return codes
+# Fields the scan writes for each station (everything else in meta is preserved)
+SCAN_FIELDS = ["status", "port", "network_port", "last_seen", "networks"]
+
+# Scan Mode: "async" queries every port at once, "serial" walks them one by one (legacy)
+SCAN_MODE = os.environ.get("NTRIP_SCAN_MODE", "async").lower()
+# Defaults when a network doesn't set max_concurrency / port_deadline
+MAX_CONCURRENCY = 8 # simultaneous caster connections in async mode
+PORT_DEADLINE = 10 # hard deadline per port (connect + full sourcetable), seconds
+
+def build_sourcetable_request(host, user, password):
+    """Builds the NTRIP 2.0 sourcetable request (GET / with Basic Auth)."""
+    # Basic Auth
+    auth_str = f"{user}:{password}"
+    auth_bytes = auth_str.encode('ascii')
+    auth_b64 = base64.b64encode(auth_bytes).decode('ascii')
+
+    # NTRIP Request
+    # Getting source table usually just requires a GET / with Ntrip-Version header
+    request = (
+        f"GET / HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        f"Ntrip-Version: 2.0\r\n"
+        f"User-Agent: NTRIP Python Client\r\n"
+        f"Authorization: Basic {auth_b64}\r\n"
+        f"Connection: close\r\n"
+        f"\r\n"
+    )
+    return request.encode('ascii')
 
 def get_sourcetable(host, port, user, password):
     """
@@ -42,46 +57,99 @@ def get_sourcetable(host, port, user, password):
         sock.settimeout(5)
         sock.connect((host, port))
 
-        # Basic Auth
-        auth_str = f"{user}:{password}"
-        auth_bytes = auth_str.encode('ascii')
-        auth_b64 = base64.b64encode(auth_bytes).decode('ascii')
-
-        # NTRIP Request
-        # Getting source table usually just requires a GET / with Ntrip-Version header
-        request = (
-            f"GET / HTTP/1.1\r\n"
-            f"Host: {host}\r\n"
-            f"Ntrip-Version: 2.0\r\n"
-            f"User-Agent: NTRIP Python Client\r\n"
-            f"Authorization: Basic {auth_b64}\r\n"
-            f"Connection: close\r\n"
-            f"\r\n"
-        )
-
-        sock.sendall(request.encode('ascii'))
-
-        response = b""
-        while True:
-            chunk = sock.recv(4096)
-            if not chunk:
-                break
-            response += chunk
+        sock.sendall(build_sourcetable_request(host, user, password))
+
+        # Records are parsed while bytes arrive; stops at ENDSOURCETABLE
+        parser = SourcetableParser()
+        records = list(iter_sourcetable(sock, parser))
 
         sock.close()
-        return response.decode('utf-8', errors='ignore')
+
+        if parser.status_code != 200:
+            print(f"Error fetching port {port}: {parser.status_line or 'No response'}")
+            return None
+        return records
 
     except Exception as e:
         print(f"Error fetching port {port}: {e}")
         return None
 
-def parse_sourcetable(data):
+async def get_sourcetable_async(host, addr, port, user, password, semaphore, deadline):
+    """
+    Async version of get_sourcetable().
+    Connects to the pre-resolved address 'addr' (Host header still uses 'host').
+    Returns (port, STR records or None, elapsed seconds, error or None).
+    """
+    async with semaphore:
+        start = time.monotonic()
+        writer = None
+        parser = SourcetableParser()
+        try:
+            async def fetch():
+                nonlocal writer
+                reader, writer = await asyncio.open_connection(addr, port)
+                writer.write(build_sourcetable_request(host, user, password))
+                await writer.drain()
+                return await read_sourcetable_async(reader, parser)
+
+            records = await asyncio.wait_for(fetch(), timeout=deadline)
+            if parser.status_code != 200:
+                return port, None, time.monotonic() - start, parser.status_line or "no response"
+            return port, records, time.monotonic() - start, None
+        except asyncio.TimeoutError:
+            return port, None, time.monotonic() - start, f"deadline ({deadline}s) exceeded"
+        except Exception as e:
+            return port, None, time.monotonic() - start, str(e)
+        finally:
+            if writer is not None:
+                writer.close()
+
+async def scan_ports_async(host, ports, user, password, max_concurrency=MAX_CONCURRENCY, deadline=PORT_DEADLINE):
+    """
+    Queries every port concurrently (capped by max_concurrency).
+    Resolves 'host' once and shares the address across all connections.
+    Returns {port: STR records or None} and prints per-port timings.
+    """
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+    addr = infos[0][4][0]
+    print(f"Resolved {host} -> {addr}. Scanning {len(ports)} ports (max {max_concurrency} at once)...")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = await asyncio.gather(*[
+        get_sourcetable_async(host, addr, port, user, password, semaphore, deadline)
+        for port in ports
+    ])
+
+    # Per-port timings, slowest first, so a lagging caster port stands out
+    print("Port timings:")
+    for port, data, elapsed, error in sorted(results, key=lambda r: r[2], reverse=True):
+        outcome = f"{len(data)} records" if data is not None else f"FAILED ({error})"
+        print(f"  Port {port}: {elapsed:.2f}s - {outcome}")
+
+    return {port: data for port, data, _, _ in results}
+
+def scan_ports_serial(host, ports, user, password):
+    """Legacy one-port-at-a-time scan. Returns {port: STR records or None}."""
+    results = {}
+    for port in ports:
+        start = time.monotonic()
+        results[port] = get_sourcetable(host, port, user, password)
+        print(f"  Port {port}: {time.monotonic() - start:.2f}s")
+        time.sleep(1)
+    return results
+
+def parse_sourcetable(records):
     """
     Parses NTRIP source table data and returns a list of mountpoints.
+    Accepts the raw text or any iterable of lines/'STR;' records
+    (e.g. the ntrip_stream.iter_sourcetable() generator).
     """
+    if isinstance(records, str):
+        records = records.splitlines()
+
     mountpoints = []
-    lines = data.splitlines()
-    for line in lines:
+    for line in records:
         if line.startswith("STR;"):
             parts = line.split(";")
             if len(parts) > 1:
@@ -89,65 +157,124 @@ def parse_sourcetable(data):
                 mountpoints.append(mountpoint)
     return mountpoints
 
-def main():
-    mapping = {}
-    
-    print(f"Connecting to {HOST}...")
-    
-    # 0. Load Existing Meta (to preserve last_seen)
-    existing_meta = {}
-    if os.path.exists("app/data/station_meta.json"):
-        try:
-            with open("app/data/station_meta.json", "r") as f:
-                existing_meta = json.load(f)
-        except Exception as e:
-            print(f"Warning: Could not load existing meta: {e}")
+# Common non-station mountpoint prefixes
+NON_STATION_PREFIXES = ["NEAR", "VRS_", "MAC_", "RTCM"]
 
-    # 1. Fetch Active Streams
+def station_code_for_mountpoint(mountpoint, network=None):
+    """
+    Returns the canonical station code for a mountpoint, or None if it isn't a station
+    stream or the station is excluded on 'network' (primary network if None).
+    """
+    if len(mountpoint) < 4:
+        return None
+    raw_code = mountpoint[:4].upper()
+    if raw_code in NON_STATION_PREFIXES or registry().is_excluded(raw_code, network):
+        return None
+    return canonical_code(raw_code)
+
+def iter_station_codes(records, network=None):
+    """Generator: station codes from sourcetable records (works on iter_sourcetable() directly)."""
+    for mountpoint in parse_sourcetable(records):
+        station_code = station_code_for_mountpoint(mountpoint, network)
+        if station_code:
+            yield station_code
+
+async def scan_networks_async(networks):
+    """
+    Scans every network's caster at the same time, each with its own
+    concurrency limit and port deadline. A network that fails (DNS, auth...)
+    comes back as None without affecting the others.
+    """
+    results = await asyncio.gather(*[
+        scan_ports_async(n.host, n.ports, n.user, n.password, n.max_concurrency, n.port_deadline)
+        for n in networks
+    ], return_exceptions=True)
+
+    port_data = {}
+    for network, result in zip(networks, results):
+        if isinstance(result, Exception):
+            print(f"[{network.name}] Scan failed: {result}")
+            result = None
+        port_data[network.name] = result
+    return port_data
+
+def scan_networks(networks):
+    """{network name: {port: STR records or None} or None} for every network with a caster."""
+    if SCAN_MODE == "serial":
+        return {n.name: scan_ports_serial(n.host, n.ports, n.user, n.password) for n in networks}
+    try:
+        return asyncio.run(scan_networks_async(networks))
+    except Exception as e:
+        print(f"Async scan failed ({e}). Falling back to serial scan...")
+        return {n.name: scan_ports_serial(n.host, n.ports, n.user, n.password) for n in networks}
+
+def collect_streams(network, port_data):
+    """
+    Active stations of one network from its sourcetables.
+    Returns (mapping {CODE: {'ports': [...]}}, active station codes, total stream count).
+    """
+    mapping = {}
     active_streams = set()
     total_streams_found = 0
 
-    for port in PORTS:
-        print(f"Checking Port {port}...", end="", flush=True)
-        data = get_sourcetable(HOST, port, USER, PASSWORD)
+    # Process in port order regardless of completion order (keeps output identical to serial path)
+    for port in network.ports:
+        print(f"[{network.name}] Checking Port {port}...", end="", flush=True)
+        data = (port_data or {}).get(port)
         
-        if data:
+        if data is not None:
             mountpoints = parse_sourcetable(data)
             count = len(mountpoints)
             print(f" Found {count} streams.")
             total_streams_found += count
             
-            for mp in mountpoints:
-                # Basic parsing
-                if len(mp) >= 4:
-                    station_code = mp[:4].upper()
-                    
-                    # Ignore common non-station mountpoints
-                    if station_code in ["NEAR", "VRS_", "MAC_", "RTCM"]:
-                        continue
-                    
-                    if station_code in EXCLUDED_STATIONS:
-                        continue
-
-                    active_streams.add(station_code)
-
-                    # Track all ports this station is seen on
-                    if station_code not in mapping:
-                        mapping[station_code] = {'ports': []}
-                    mapping[station_code]['ports'].append(port)
+            for station_code in iter_station_codes(data, network):
+                active_streams.add(station_code)
+
+                # Track all ports this station is seen on
+                if station_code not in mapping:
+                    mapping[station_code] = {'ports': []}
+                mapping[station_code]['ports'].append(port)
         else:
             print(" No data/Connection failed.")
-        
-        time.sleep(1)
 
-    # FAIL-SAFE: If we found 0 streams total, something is wrong with network/auth.
-    # Do NOT overwrite the file with empty data.
-    if total_streams_found == 0:
-        print("\nCRITICAL ERROR: No streams found on any port!")
-        print("Possible causes: Network down, detailed auth failure, or caster maintenance.")
-        print("ABORTING UPDATE to preserve existing map data.")
-        return
+    return mapping, active_streams, total_streams_found
+
+def scan_active_streams(networks):
+    """
+    Scans every network's caster ports concurrently and merges the results.
+    Returns (mapping {CODE: {'ports': [...]}}, active station codes, total stream count,
+    {CODE: {network: {'ports': [...]}}}). A station on several networks takes its
+    ports from the first one in networks.json order.
+    """
+    networks = [n for n in networks if n.has_caster]
+    port_data = scan_networks(networks)
 
+    mapping = {}
+    active_streams = set()
+    total_streams_found = 0
+    station_networks = {}
+    for network in networks:
+        net_mapping, net_active, net_total = collect_streams(network, port_data.get(network.name))
+        print(f"[{network.name}] {net_total} streams, {len(net_active)} stations.")
+        total_streams_found += net_total
+        active_streams |= net_active
+        for code, entry in net_mapping.items():
+            mapping.setdefault(code, entry)
+            station_networks.setdefault(code, {})[network.name] = {'ports': entry['ports']}
+
+    return mapping, active_streams, total_streams_found, station_networks
+
+def build_station_meta(existing_meta, mapping, active_streams, current_time, station_networks=None, networks=None):
+    """
+    Status + ports for every known/active station (last_seen and offline ports preserved).
+    'station_networks' ({CODE: {network: {'ports': [...]}}}) is stored per station as "networks".
+    Seen ports are split into single-site / network ports by the station's network
+    ('networks', from networks.json if not given; the primary network when the station has none).
+    """
+    if networks is None:
+        networks = load_networks()
+    primary = networks[0] if networks else None
     # 2. Manual Overrides (User Request)
     OVERRIDE_PORTS = {
         # "NTGT": 4806, # Removed
@@ -155,7 +282,7 @@ def main():
     }
     
     # 3. Load Known Stations (for Offline detection)
-    known_stations = load_known_stations("app/data/Sites_20250725_Global.geojson")
+    known_stations = registry().codes(GLOBAL_GEOJSON)
     
     # 4. Determine Status & Build Meta Data
     # Meta data structure: {"CODE": {"single_port": 1234, "network_port": 5678, "status": "Online", "last_seen": "YYYY-MM-DD HH:MM"}}
@@ -163,19 +290,11 @@ def main():
     
     all_codes = known_stations.union(active_streams)
     
-    # Define Network Port Ranges or Map
-    NETWORK_MAP = {
-        4801: 4811, 4802: 4812, 4803: 4813, 
-        4804: 4814, 4806: None, 4807: None, 4809: None # Others might not have net ports?
-        # Actually user said "network ports are for certian stations only".
-        # We just check if they appear in any of the known network ports (4810-4815?)
-    }
-    NETWORK_PORTS_RANGE = range(4810, 4816)
-
-    current_time = time.strftime("%Y-%m-%d %H:%M")
-
     for code in all_codes:
-        if code in EXCLUDED_STATIONS:
+        # The station's network (first in networks.json order): exclusions + port ranges
+        names = (station_networks or {}).get(code) or existing_meta.get(code, {}).get('networks') or {}
+        network = next((n for n in networks if n.name in names), primary)
+        if registry().is_excluded(code, network):
             continue
             
         is_online = code in active_streams
@@ -183,23 +302,26 @@ def main():
         
         # Determine specific ports
         seen_ports = mapping.get(code, {}).get('ports', [])
-        
-        # Find Single Site Port (e.g., < 4810)
+
+        single_ports = network.single_ports if network else set()
+        network_ports = network.network_ports if network else set()
+
+        # Find Single Site Port
         single_port = None
         for p in seen_ports:
-            if p < 4810: 
+            if p in single_ports:
                 single_port = p
-                break 
+                break
         
         # Override Single Port if manual
         if code in OVERRIDE_PORTS:
             single_port = OVERRIDE_PORTS[code]
             if status == "Offline": status = "Online" # Force online if overridden
 
-        # Find Network Port (e.g., >= 4810)
+        # Find Network Port
         network_port = None
         for p in seen_ports:
-            if p in NETWORK_PORTS_RANGE:
+            if p in network_ports:
                 network_port = p
                 break
         
@@ -218,23 +340,66 @@ def main():
             "status": status,
             "port": single_port, # Primary Single Port
             "network_port": network_port, # If available
-            "last_seen": last_seen
+            "last_seen": last_seen,
+            # Per-network results (previous ones kept while Offline)
+            "networks": (station_networks or {}).get(code) or existing_meta.get(code, {}).get('networks', {}),
         }
 
+    return station_meta
+
+def merge_scan(existing_meta, scanned):
+    """
+    New station_meta: each scanned station's existing entry (state, health, stream...)
+    with the scan fields copied in. The scan's status/last_seen are replaced by the
+    previous ones so the caller can feed its sample through station_state.apply_sample.
+    """
+    meta = {}
+    for code, fields in scanned.items():
+        previous = existing_meta.get(code, {})
+        meta[code] = dict(previous)
+        meta[code].update(fields)
+        meta[code]['status'] = previous.get('status', fields['status'])
+        meta[code]['last_seen'] = previous.get('last_seen', 'Never')
+    return meta
+
+def main():
+    networks = load_networks()
+    print("Scanning " + ", ".join(f"{n.name} ({n.host})" for n in networks if n.has_caster) + "...")
+    
+    # 0. Load Existing Meta (to preserve last_seen)
+    existing_meta = registry().meta
+
+    # 1. Fetch Active Streams
+    mapping, active_streams, total_streams_found, station_networks = scan_active_streams(networks)
+
+    # FAIL-SAFE: If we found 0 streams total, something is wrong with network/auth.
+    # Do NOT overwrite the file with empty data.
+    if total_streams_found == 0:
+        print("\nCRITICAL ERROR: No streams found on any port!")
+        print("Possible causes: Network down, detailed auth failure, or caster maintenance.")
+        print("ABORTING UPDATE to preserve existing map data.")
+        return
+
+    current_time = time.strftime("%Y-%m-%d %H:%M")
+    scanned = build_station_meta(existing_meta, mapping, active_streams, current_time, station_networks, networks)
+    station_meta = merge_scan(existing_meta, scanned)
+    for code, data in station_meta.items():
+        apply_sample(data, code in active_streams, current_time)
+
     # 5. Save/Export
     
     # A. Station Port Mapping (Backwards compatibility for python script)
     # Only save stations that HAVE a port assigned
     clean_mapping = {k: v['port'] for k, v in station_meta.items() if v['port'] is not None}
     
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(clean_mapping, f, indent=4, sort_keys=True)
+    write_json_atomic(OUTPUT_FILE, clean_mapping, indent=4, sort_keys=True)
     print(f"Mapping saved to {OUTPUT_FILE}")
 
     # B. Station Meta (for JS - Status + Port)
-    with open("app/data/station_meta.json", "w") as f:
-        json.dump(station_meta, f, indent=4, sort_keys=True)
-    print(f"Station Metadata saved to app/data/station_meta.json")
+    write_json_atomic(META_FILE, station_meta, indent=4, sort_keys=True)
+    publish_status_feed(station_meta)
+    print(f"Station Metadata saved to {META_FILE}")
+    update_history(station_meta, "sourcetable")
 
     # C. QA Text Report
     report_lines = []
@@ -271,8 +436,7 @@ def main():
     report_content = "\n".join(report_lines)
     print(report_content)
     
-    with open("app/data/QA_Port_Assignments.txt", "w") as f:
-        f.write(report_content)
+    write_atomic("app/data/QA_Port_Assignments.txt", report_content)
     print("QA Report saved to app/data/QA_Port_Assignments.txt")
 
 if __name__ == "__main__":
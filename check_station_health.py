@@ -1,155 +1,421 @@
 import socket
-import json
 import base64
 import time
 import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 from datetime import datetime
-from pyrtcm import RTCMReader, RTCMMessage
+import numpy as np
+from rtcm_frames import (RTCMFramer, MSMSummary, msm_latency_ms, percentiles,
+                         ARP_TYPES, decode_arp, frame_payload)
+from networks import load_networks, station_networks
+from probe_scheduler import schedule, mark_probed
+from atomic_io import write_json_atomic
+from stations import read_meta, registry
 
 # Configuration
-HOST = "www.smartfix.co.nz"
-USER = os.environ.get("NTRIP_USER")
-PASSWORD = os.environ.get("NTRIP_PASSWORD")
+# Caster host/credentials per network come from networks.json; these are the primary network's
+NETWORKS = [n for n in load_networks() if n.has_caster]
+HOST = NETWORKS[0].host if NETWORKS else os.environ.get("NTRIP_HOST", "www.smartfix.co.nz")
+USER = NETWORKS[0].user if NETWORKS else os.environ.get("NTRIP_USER")
+PASSWORD = NETWORKS[0].password if NETWORKS else os.environ.get("NTRIP_PASSWORD")
 TIMEOUT = 5 # seconds per station
+META_FILE = "app/data/station_meta.json"
+QA_FILE = "app/data/QA_Port_Assignments.txt"
 
-# MSM Message Types (contain sat counts)
-MSM_TYPES = [
-    '1074', '1075', '1076', '1077', # GPS
-    '1084', '1085', '1086', '1087', # GLONASS
-    '1094', '1095', '1096', '1097', # GALILEO
-    '1124', '1125', '1126', '1127'  # BEIDOU
-]
+# Parallel Probing
+# Max probes running at once (all ports combined)
+MAX_WORKERS = int(os.environ.get("HEALTH_MAX_WORKERS", "32"))
+# Max simultaneous connections per caster port (stay under the caster's connection limits)
+PER_PORT_LIMIT = int(os.environ.get("HEALTH_PER_PORT_LIMIT", "4"))
+# Whole deep check must finish within this many seconds (unfinished probes are skipped)
+GLOBAL_DEADLINE = float(os.environ.get("HEALTH_GLOBAL_DEADLINE", "55"))
+# Results are streamed into station_meta.json at most this often (seconds), plus once at the end
+META_WRITE_INTERVAL = 2
+
+# Keep reading (up to TIMEOUT) until this many MSM epochs are seen, for the satellite summary
+MIN_MSM_EPOCHS = 2
+# Correction latency (MSM epoch -> received) above this p95 is flagged as slow, ms
+LATENCY_WARN_MS = int(os.environ.get("HEALTH_LATENCY_WARN_MS", "2000"))
+LATENCY_SECTION = "CORRECTION LATENCY"
+
+# Probe only stations the adaptive scheduler says are due (probe_scheduler.py); 1 = probe all
+PROBE_ALL = os.environ.get("HEALTH_PROBE_ALL", "0") == "1"
+
+# Reference coordinate drift check (broadcast 1005/1006 ARP vs published GeoJSON coordinates)
+# Probes keep reading (up to TIMEOUT) until an ARP message arrives
+ARP_CHECK = os.environ.get("HEALTH_ARP_CHECK", "1") == "1"
+ARP_WARN_HORIZONTAL_M = float(os.environ.get("HEALTH_ARP_WARN_HORIZONTAL_M", "0.5"))
+ARP_WARN_VERTICAL_M = float(os.environ.get("HEALTH_ARP_WARN_VERTICAL_M", "1.0"))
+
+# GRS80 / WGS84 (differences are sub-mm at these scales)
+ELLIPSOID_A = 6378137.0
+ELLIPSOID_F = 1 / 298.257222101
 
 def get_station_meta():
-    try:
-        with open("app/data/station_meta.json", "r") as f:
-            return json.load(f)
-    except:
-        return {}
+    """A fresh read of station_meta.json (station_monitor.py re-reads it for every snapshot)."""
+    return read_meta(META_FILE)
+
+def save_station_meta(meta):
+    """Writes meta via temp file + rename so readers never see a half-written file."""
+    write_json_atomic(META_FILE, meta, indent=4, sort_keys=True)
 
-def check_station(code, port):
-    print(f"Checking {code} on port {port}...", end="", flush=True)
+def build_stream_request(code, host=None, user=None, password=None):
+    """NTRIP 2.0 request for a station's single-site mountpoint (Basic Auth, primary network by default)."""
+    host = host or HOST
+    auth_str = f"{user or USER}:{password or PASSWORD}"
+    auth_b64 = base64.b64encode(auth_str.encode('ascii')).decode('ascii')
     
+    mountpoint = f"{code}singleADV4" # Assuming this is the standard MP logic
+    
+    req = (
+        f"GET /{mountpoint} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        f"Ntrip-Version: 2.0\r\n"
+        f"User-Agent: INVALID_SOURCE\r\n" # Sometimes standard client works better
+        f"Authorization: Basic {auth_b64}\r\n"
+        f"Connection: close\r\n"
+        f"\r\n"
+    )
+    return req.encode('ascii')
+
+def check_station(code, port, network=None):
+    """
+    Probes one mountpoint for TIMEOUT seconds (on 'network's caster, primary by default).
+    Returns (has_data, msg_count, details) where details holds the
+    per-constellation MSM summary ('constellations'), 'sats_tracked' and
+    'latency_ms' (p50/p95/max of MSM epoch -> receive time) and 'arp'
+    (first 1005/1006 antenna reference point, ECEF metres).
+    """
+    details = {}
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(TIMEOUT)
-        sock.connect((HOST, int(port)))
+        host = network.host if network else HOST
+        # Closed on every path (probe_all runs hundreds of these in thread pools)
+        with socket.create_connection((host, int(port)), timeout=TIMEOUT) as sock:
+            # Send NTRIP Request
+            if network:
+                sock.sendall(build_stream_request(code, network.host, network.user, network.password))
+            else:
+                sock.sendall(build_stream_request(code))
 
-        # Send NTRIP Request
-        auth_str = f"{USER}:{PASSWORD}"
-        auth_b64 = base64.b64encode(auth_str.encode('ascii')).decode('ascii')
-        
-        mountpoint = f"{code}singleADV4" # Assuming this is the standard MP logic
-        
-        req = (
-            f"GET /{mountpoint} HTTP/1.1\r\n"
-            f"Host: {HOST}\r\n"
-            f"Ntrip-Version: 2.0\r\n"
-            f"User-Agent: INVALID_SOURCE\r\n" # Sometimes standard client works better
-            f"Authorization: Basic {auth_b64}\r\n"
-            f"Connection: close\r\n"
-            f"\r\n"
-        )
-        sock.sendall(req.encode('ascii'))
-        
-        # Reader
-        rtr = RTCMReader(sock)
-        
-        sats_seen = set()
-        start_time = time.time()
-        
-        msg_count = 0
-        
-        while time.time() - start_time < TIMEOUT:
-            try:
-                (raw_data, parsed_data) = rtr.read()
-                if parsed_data:
+            # Raw RTCM3 framing (CRC-checked, message type only - no full decode)
+            framer = RTCMFramer()
+            buf = bytearray(4096)
+            view = memoryview(buf)
+
+            types_seen = set()
+            msm = MSMSummary()
+            latencies = []
+            start_time = time.time()
+
+            msg_count = 0
+
+            while time.time() - start_time < TIMEOUT:
+                sock.settimeout(max(0.1, TIMEOUT - (time.time() - start_time)))
+                try:
+                    n = sock.recv_into(buf)
+                except socket.timeout:
+                    break
+                if n == 0:
+                    break
+                rx_time = time.time()
+
+                for msg_type, frame in framer.feed(view[:n]):
                     msg_count += 1
-                    mid = parsed_data.identity
-                    
-                    # Check for MSM
-                    if mid in MSM_TYPES or mid.startswith('10'):
-                        # Try to extract sat count or PRNs
-                        # pyrtcm parses MSM signals. We can count unique SatIDs.
-                        # Usually 'DF009' array or similar logic depending on the attribute names
-                        # Detailed parsing might be complex, but let's look for known attributes
-                        
-                        # Simplified: If we get ANY valid Position (1005/1006) or MSM, it's "Working"
-                        # To be specific about "0 satellites", we need to sum signals.
-                        pass
-                        
-                    # Just count valid RTCM messages for now as "Health"
-                    # If we get > 5 messages in 5 seconds, it's sending data.
-                    
-                    # For specific Satellite counts, we'd iterate parsed_data properties
-                    # But verifying "Positional Data" usually specifically means 1005/1006 (Base Position)
-                    # User asked for "streaming positional data... 0 satellites". 
-                    # MSM = Observables (Sats). 1005 = Station Position.
-                    
-                    # Let's count bytes/messages.
-                    if msg_count > 5:
-                        break
-            except Exception as e:
-                # Read error or timeout
-                pass
-
-        sock.close()
+                    types_seen.add(msg_type)
+
+                    # MSM = Observables (Sats). 1005/1006 = Station Position.
+                    # MSM headers give the satellite/signal masks (header-only decode)
+                    header = msm.add(msg_type, frame)
+                    if header:
+                        latency = msm_latency_ms(header, rx_time)
+                        if latency is not None:
+                            latencies.append(latency)
+                    elif msg_type in ARP_TYPES and 'arp' not in details:
+                        arp = decode_arp(frame_payload(frame))
+                        if arp:
+                            details['arp'] = arp
+
+                # > 5 messages means it's sending data; wait for full MSM epochs for the sat counts
+                # (and the ARP message, usually sent every few seconds)
+                if msg_count > 5 and msm.epochs >= MIN_MSM_EPOCHS and (not ARP_CHECK or 'arp' in details):
+                    break
+
+        msm.flush()
         
         if msg_count > 0:
-            print(f" OK ({msg_count} msgs)")
-            return True, msg_count
+            details['constellations'] = msm.summary()
+            details['sats_tracked'] = msm.sats_tracked()
+            details['latency_ms'] = percentiles(latencies)
+
+        # Single write per station (probes run in parallel, partial lines would interleave)
+        if msg_count > 0:
+            sats = details['sats_tracked']
+            sats_text = "sats n/a" if sats is None else f"{sats} sats"
+            latency = details['latency_ms']
+            latency_text = f", latency p50 {latency['p50']} ms" if latency else ""
+            warning = " - TRACKING NOTHING" if sats == 0 else ""
+            print(f"{code} (port {port}): OK ({msg_count} msgs, {sats_text}{latency_text}, types {sorted(types_seen)}){warning}\n", end="")
+            return True, msg_count, details
         else:
-            print(f" NO DATA (0 msgs)")
-            return False, 0
+            print(f"{code} (port {port}): NO DATA (0 msgs)\n", end="")
+            return False, 0, details
             
     except Exception as e:
-        print(f" ERROR: {e}")
-        return False, 0
+        print(f"{code} (port {port}): ERROR: {e}\n", end="")
+        return False, 0, details
+
+def interleave_by_port(targets):
+    """
+    Orders (code, port) targets round-robin across ports so the worker pool
+    isn't filled with probes all queued behind the same port limit.
+    """
+    by_port = defaultdict(list)
+    for code, port in targets:
+        by_port[port].append((code, port))
+
+    ordered = []
+    queues = [by_port[p] for p in sorted(by_port)]
+    while any(queues):
+        for q in queues:
+            if q:
+                ordered.append(q.pop(0))
+    return ordered
+
+def probe_all(targets, on_result, max_workers=MAX_WORKERS, per_port_limit=PER_PORT_LIMIT, deadline=GLOBAL_DEADLINE,
+              networks=None):
+    """
+    Probes all (code, port) targets in bounded worker pools.
+    'networks' ({code: Network}) picks each station's caster (primary otherwise).
+    Every caster host gets its own pool (max_workers, capped by the network's
+    probe_concurrency) so a slow network can't tie up the others' workers.
+    At most 'per_port_limit' connections are open per caster host/port at any time.
+    on_result(code, is_active, count, details) is called as each probe finishes.
+    Returns the list of codes that did not finish before the global deadline.
+    """
+    networks = networks or {}
+    port_limits = defaultdict(lambda: threading.BoundedSemaphore(per_port_limit))
+    pools = {}
+    for code, port in targets:
+        network = networks.get(code)
+        host = network.host if network else HOST
+        port_limits[(host, port)] # Create up front (defaultdict isn't thread-safe on insert)
+        if host not in pools:
+            workers = min(max_workers, network.probe_concurrency) if network else max_workers
+            pools[host] = ThreadPoolExecutor(max_workers=workers)
+
+    def probe(code, port, network):
+        with port_limits[(network.host if network else HOST, port)]:
+            return check_station(code, port, network)
+
+    futures = {}
+    for code, port in interleave_by_port(targets):
+        network = networks.get(code)
+        pool = pools[network.host if network else HOST]
+        futures[pool.submit(probe, code, port, network)] = code
+    pending = set(futures.values())
+
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            code = futures[future]
+            is_active, count, details = future.result()
+            pending.discard(code)
+            on_result(code, is_active, count, details)
+    except FuturesTimeout:
+        print(f"GLOBAL DEADLINE ({deadline}s) reached. {len(pending)} stations not checked.")
+    finally:
+        # Don't start queued probes after the deadline; running ones end within TIMEOUT
+        for pool in pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return sorted(pending)
+
+def ecef_to_geodetic(x, y, z):
+    """
+    Vectorized ECEF -> geodetic (GRS80). x, y, z are NumPy arrays (metres).
+    Returns (lat_deg, lon_deg, height_m) arrays. Bowring start + 3 iterations (sub-mm).
+    """
+    a = ELLIPSOID_A
+    e2 = ELLIPSOID_F * (2 - ELLIPSOID_F)
+    p = np.hypot(x, y)
+    lon = np.arctan2(y, x)
+    lat = np.arctan2(z, p * (1 - e2))
+    for _ in range(3):
+        n = a / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+        height = p / np.cos(lat) - n
+        lat = np.arctan2(z, p * (1 - e2 * n / (n + height)))
+    n = a / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    height = p / np.cos(lat) - n
+    return np.degrees(lat), np.degrees(lon), height
+
+def load_published_coords():
+    """{code: (lat, lon, height)} from the station GeoJSONs (latitude_dd, longitude_dd, Height)."""
+    return {station.code: (station.lat, station.lon, station.height) for station in registry()
+            if station.lat is not None and station.height is not None}
+
+def check_arp_drift(arps):
+    """
+    Compares broadcast ARPs ({code: arp dict}) with the published coordinates,
+    converting all of them in one vectorized batch.
+    Returns {code: {'lat', 'lon', 'height', 'horizontal_m', 'vertical_m', 'flagged'}}.
+    """
+    published = load_published_coords()
+    codes = [c for c in sorted(arps) if c in published]
+    if not codes:
+        return {}
+
+    x = np.array([arps[c]['x'] for c in codes])
+    y = np.array([arps[c]['y'] for c in codes])
+    z = np.array([arps[c]['z'] for c in codes])
+    lat, lon, height = ecef_to_geodetic(x, y, z)
+
+    pub = np.array([published[c] for c in codes], dtype=float)
+    pub_lat, pub_lon, pub_height = pub[:, 0], pub[:, 1], pub[:, 2]
+
+    # Local north/east offsets (metres) - fine for differences of a few km at most
+    e2 = ELLIPSOID_F * (2 - ELLIPSOID_F)
+    lat_rad = np.radians(pub_lat)
+    sin2 = np.sin(lat_rad) ** 2
+    n_radius = ELLIPSOID_A / np.sqrt(1 - e2 * sin2)
+    m_radius = ELLIPSOID_A * (1 - e2) / (1 - e2 * sin2) ** 1.5
+    d_lon = (lon - pub_lon + 180) % 360 - 180
+    north = np.radians(lat - pub_lat) * m_radius
+    east = np.radians(d_lon) * n_radius * np.cos(lat_rad)
+    horizontal = np.hypot(north, east)
+    vertical = height - pub_height
+    flagged = (horizontal > ARP_WARN_HORIZONTAL_M) | (np.abs(vertical) > ARP_WARN_VERTICAL_M)
+
+    return {
+        code: {
+            'lat': round(float(lat[i]), 9),
+            'lon': round(float(lon[i]), 9),
+            'height': round(float(height[i]), 4),
+            'horizontal_m': round(float(horizontal[i]), 3),
+            'vertical_m': round(float(vertical[i]), 3) + 0.0, # no -0.0
+            'flagged': bool(flagged[i]),
+        }
+        for i, code in enumerate(codes)
+    }
+
+def latency_report_lines(meta):
+    """Latency section of the QA report (empty list if no station reported latency)."""
+    rows = [(code, data['latency_ms']) for code, data in meta.items() if data.get('latency_ms')]
+    if not rows:
+        return []
+
+    report_lines = [f"\n\n{LATENCY_SECTION} (MSM epoch -> received, ms; slow if p95 > {LATENCY_WARN_MS})"]
+    slow = sorted(code for code, lat in rows if lat['p95'] > LATENCY_WARN_MS)
+    if slow:
+        report_lines.append(f"SLOW ({len(slow)}): {', '.join(slow)}")
+    # Slowest first
+    for code, lat in sorted(rows, key=lambda r: r[1]['p95'], reverse=True):
+        report_lines.append(f"{code}: p50 {lat['p50']}, p95 {lat['p95']}, max {lat['max']} ({lat['samples']} msgs)")
+    return report_lines
+
+def apply_probe_result(meta, code, is_active, details):
+    """Copies one probe's fields into meta[code] (data_verified, sats_tracked, constellations, latency_ms)."""
+    if code in meta:
+        mark_probed(meta[code])
+        meta[code]['data_verified'] = is_active
+        if is_active:
+            meta[code]['sats_tracked'] = details.get('sats_tracked')
+            meta[code]['constellations'] = details.get('constellations', {})
+            meta[code]['latency_ms'] = details.get('latency_ms')
+
+def apply_arp_checks(meta, arps):
+    """Runs the ARP drift check for {code: arp} and stores it as meta[code]['arp_check']. Returns the checks."""
+    drift = check_arp_drift(arps)
+    for code, check in drift.items():
+        if code in meta:
+            meta[code]['arp_check'] = check
+    return drift
+
+def select_targets(meta):
+    """(code, port) to probe this run: due stations from the scheduler, or every Online one."""
+    if not PROBE_ALL:
+        return schedule(meta)
 
-def main():
-    meta = get_station_meta()
-    
     # Filter for Online stations that have a port
     targets = []
     for code, data in meta.items():
-        if data.get('status') == 'Online' and data.get('port'):
+        if data.get('status') in ('Online', 'Degraded') and data.get('port'):
             targets.append((code, data['port']))
+    return targets
+
+def write_latency_report(meta):
+    """
+    Appends (or replaces) the latency section of the QA report.
+    The rest of the report is owned by check_api_status.py / check_ntrip_ports.py.
+    """
+    report_lines = latency_report_lines(meta)
+    if not report_lines:
+        return
+
+    existing = ""
+    if os.path.exists(QA_FILE):
+        with open(QA_FILE, "r") as f:
+            existing = f.read()
+    # Drop the section from a previous run
+    marker = existing.find(f"\n\n{LATENCY_SECTION}")
+    if marker >= 0:
+        existing = existing[:marker]
+
+    with open(QA_FILE, "w") as f:
+        f.write(existing + "\n".join(report_lines))
+    print(f"Latency report added to {QA_FILE}")
+
+def main():
+    meta = registry().meta
+    
+    targets = select_targets(meta)
             
-    print(f"Deep checking {len(targets)} stations...")
+    print(f"Deep checking {len(targets)} stations "
+          f"({MAX_WORKERS} workers, {PER_PORT_LIMIT} per port, {GLOBAL_DEADLINE}s deadline)...")
     
     results = {}
-    
-    # Limit to first 5 for test as requested by user ("give current check a go... just testing")
-    # Actually user said "give current check a go", implying the whole thing.
-    # But checking 130 stations * 5 sec = 10 minutes.
-    # I'll enable a fast mode or verify just one region?
-    # I will do ALL but with a short timeout? No, connection takes time.
-    # User said "i can disable it if i find it too slow." -> Implies run it.
-    
-    for code, port in targets:
-        is_active, count = check_station(code, port)
+    arps = {}
+    start = time.monotonic()
+    last_write = start
+
+    # Stream each result into station_meta.json as it arrives
+    # New fields: "data_verified" (Boolean), "sats_tracked" (Int/None), "constellations" (MSM summary)
+    def on_result(code, is_active, count, details):
         results[code] = {
             "has_data": is_active,
             "msg_count": count,
             "last_checked": datetime.now().isoformat()
         }
-        
-    # Update Metadata?
-    # Or just print report?
-    # User wants to "see which are working".
-    # I'll update station_meta.json with a new field "data_verified": Boolean
-    
-    for code, res in results.items():
-        if code in meta:
-            meta[code]['data_verified'] = res['has_data']
-            
-        # Add delay to prevent server blocking (Concurrent connections)
-        time.sleep(2)
-            
-    with open("app/data/station_meta.json", "w") as f:
-        json.dump(meta, f, indent=4, sort_keys=True)
-        
-    print("Done. Metadata updated.")
+        apply_probe_result(meta, code, is_active, details)
+        if details.get('arp'):
+            arps[code] = details['arp']
+
+        nonlocal last_write
+        if time.monotonic() - last_write >= META_WRITE_INTERVAL:
+            save_station_meta(meta)
+            last_write = time.monotonic()
+
+    skipped = probe_all(targets, on_result, networks=station_networks(meta, NETWORKS))
+    save_station_meta(meta)
+    if skipped:
+        print(f"Not checked (deadline): {', '.join(skipped)}")
+
+    verified = sum(1 for r in results.values() if r['has_data'])
+    blind = sorted(c for c in results if results[c]['has_data'] and meta.get(c, {}).get('sats_tracked') == 0)
+    if blind:
+        print(f"Online but tracking 0 satellites: {', '.join(blind)}")
+    # Broadcast ARP vs published coordinates (one batch for all stations)
+    if arps:
+        drift = apply_arp_checks(meta, arps)
+        save_station_meta(meta)
+        moved = sorted(c for c, chk in drift.items() if chk['flagged'])
+        print(f"ARP checked for {len(drift)} stations.")
+        if moved:
+            print("Broadcast ARP differs from published coordinates: " + ", ".join(
+                f"{c} ({drift[c]['horizontal_m']} m H, {drift[c]['vertical_m']} m V)" for c in moved))
+
+    write_latency_report(meta)
+    print(f"Done in {time.monotonic() - start:.1f}s. {verified}/{len(results)} stations sending data. Metadata updated.")
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,16 @@
-import geopandas as gpd
-import pandas as pd
-from shapely.geometry import box, MultiPoint, Point
-from shapely.ops import voronoi_diagram
+import bisect
+import hashlib
 import os
 import json
+import numpy as np
+
+import port_mask
+from atomic_io import write_json_atomic
+from port_mask import file_hash, load_mask, clip_to_mask, coverage_dissolve
+from stations import registry, SITES_GEOJSONS, MAPPING_FILE
+
+# geopandas / shapely are imported in build_regions(): a run whose inputs
+# haven't changed since the last build (see MANIFEST_FILE) exits before that.
 
 # --- Configuration matching script.js ---
 
@@ -30,10 +37,6 @@ PORT_NAMES = {
     4801: 'Otago / Southland'
 }
 
-# Specific port overrides
-# Sources: User Request + Knowledgebase Search
-import json
-
 # Specific port overrides
 # Sources: User Request + Knowledgebase Search
 # NOTE: This static list is now a fallback. We load authoritative data from JSON below.
@@ -43,16 +46,9 @@ SPECIFIC_PORTS = {
     # (Leaving empty here for brevity in diff, but I will actually just REPLACE the initialization)
 }
 
-# Load Authoritative Mapping
-try:
-    with open("app/data/station_port_mapping.json", "r") as f:
-        MAPPED_PORTS = json.load(f)
-        # Convert values to int just in case
-        MAPPED_PORTS = {k: int(v) for k, v in MAPPED_PORTS.items()}
-        print(f"Loaded {len(MAPPED_PORTS)} authoritative port mappings.")
-except Exception as e:
-    print(f"Warning: Could not load station_port_mapping.json: {e}")
-    MAPPED_PORTS = {}
+# Load Authoritative Mapping (station registry, stations.py)
+MAPPED_PORTS = registry().mapping
+print(f"Loaded {len(MAPPED_PORTS)} authoritative port mappings.")
 
 # Merge: MAPPED_PORTS takes precedence over hardcoded defaults if we wanted, 
 # but effectively we just use get_port_for_station logic.
@@ -120,70 +116,186 @@ SPECIFIC_PORTS['HANM'] = 4803
 
 # File Paths
 DATA_DIR = "app/data"
-GLOBAL_GEOJSON = os.path.join(DATA_DIR, "Sites_20250725_Global.geojson")
-LINZ_GEOJSON = os.path.join(DATA_DIR, "Sites_20250725_LINZ.geojson")
 MASK_GPKG = "Geopackage Files/Port mask area.gpkg"
 OUTPUT_GPKG = "Geopackage Files/Port_Regions_Clipped.gpkg"
 OUTPUT_WEB_GEOJSON = os.path.join(DATA_DIR, "Port_Regions.geojson")
+# Compiled overrides + latitude bands, used by getPortForStation() in app/script.js
+OUTPUT_PORT_TABLE = os.path.join(DATA_DIR, "port_assignment.json")
+
+# Content hashes of every input of the last successful build
+# (committed with the other app/data JSON so CI runs can skip too)
+MANIFEST_FILE = os.path.join(DATA_DIR, "port_regions_manifest.json")
+FORCE_BUILD = os.environ.get("PORT_REGIONS_FORCE", "0") == "1"
+
+# Vertex snap (degrees) before the per-port coverage union, so coastline
+# intersections of neighbouring cells line up (1e-9 deg is ~0.1 mm). 0 = off
+DISSOLVE_GRID_SIZE = 1e-9
 
 # Bounding Box for Voronoi (matching script.js)
 # [minX, minY, maxX, maxY] -> 160.0, -50.0, 185.0, -30.0
-BBOX = box(160.0, -50.0, 185.0, -30.0)
+BBOX_BOUNDS = (160.0, -50.0, 185.0, -30.0)
+
+# --- Ghost Stations (User requested to define borders) ---
+# These force the Voronoi polygons to extend into empty areas.
+GHOST_STATIONS = [
+    # "Between Haas and Hoki" - approx Westland/Main Divide
+    # {'Site Code': 'GHOST_WEST', 'lon': 170.0, 'lat': -43.3, 'port': 4802},
+    # Cook Strait Fix: Cape Koamaru (Marlborough Sounds Tip) -> Nelson (4802)
+    # Pushes Wellington (Red) back to North Island
+    {'Site Code': 'GHOST_KOAMARU', 'lon': 174.383, 'lat': -41.116, 'port': 4802}
+]
+
+# Latitude-based fallback as sorted breakpoints (south to north):
+# port = BAND_PORTS[number of breakpoints below lat], i.e. a station exactly
+# on a breakpoint belongs to the band south of it.
+BAND_BREAKPOINTS = [-44.5, -42.5, -41.5, -40.5, -39.0, -38.0]
+BAND_PORTS = [
+    4801, # Otago / Southland
+    4803, # Canterbury
+    4802, # Nelson / Marlborough / West Coast
+    4804, # Wellington / Lower North
+    4806, # Central North Island
+    4807, # Bay of Plenty / Waikato
+    4809, # Auckland / Northland
+]
 
 def get_port_for_station(station_code, lat):
     """
-    Determines the port ID based on station code or latitude.
-    Matches logic in app/script.js
+    Determines the port ID based on station code or latitude (single station).
+    Same table as assign_ports() and app/script.js (port_assignment.json).
     """
     # 1. Check specific overrides
     if station_code in SPECIFIC_PORTS:
         return SPECIFIC_PORTS[station_code]
 
     # 2. Latitude-based Fallback
-    if lat > -38.0: return 4809
-    if lat > -39.0: return 4807
-    if lat > -40.5: return 4806
-    if lat > -41.5: return 4804
-    # South Island
-    if lat > -42.5: return 4802
-    if lat > -44.5: return 4803
+    return BAND_PORTS[bisect.bisect_left(BAND_BREAKPOINTS, lat)]
 
-    return 4801
+def assign_ports(codes, lats):
+    """
+    Vectorized get_port_for_station: 'codes' is a pandas Series of site codes,
+    'lats' the station latitudes. One dict mapping for the overrides, one
+    searchsorted pass for the bands. Returns an int array.
+    """
+    band_ports = np.asarray(BAND_PORTS)[np.searchsorted(BAND_BREAKPOINTS, np.asarray(lats, dtype=float), side='left')]
+    explicit = codes.map(SPECIFIC_PORTS).to_numpy(dtype=float)
+    return np.where(np.isnan(explicit), band_ports, explicit).astype(int)
 
-EXCLUDED_STATIONS = ["TREC", "trec", "2GRO", "2GR0", "1778", "7651", "xGRX", "xgrx", "GSMG", "gsmg", "NTGT", "JTGT"]
+def export_port_table(path=OUTPUT_PORT_TABLE):
+    """Writes the compiled port table for the web map."""
+    table = {
+        "overrides": SPECIFIC_PORTS,
+        "breakpoints": BAND_BREAKPOINTS,
+        "ports": BAND_PORTS,
+    }
+    write_json_atomic(path, table, indent=4, sort_keys=True)
 
-def main():
-    print("Loading station data...")
+def unique_locations(xs, ys):
+    """
+    Indices of the first station at each distinct (x, y), in input order, and
+    for every station the position of its location in that list.
+    Coincident stations share one Voronoi cell (GEOS would merge them anyway).
+    """
+    coords = np.column_stack([xs, ys])
+    _, first, inverse = np.unique(coords, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.ravel()]
+
+def voronoi_cells(points, envelope):
+    """
+    Voronoi cells for distinct shapely points; cell i belongs to points[i].
+    Uses GEOS's input-ordered output (shapely 2.1+ / GEOS 3.12+), otherwise one
+    bulk STRtree query (each site lies strictly inside its own cell).
+    """
+    import shapely
+    from shapely.errors import UnsupportedGEOSVersionError
+
+    points = np.asarray(points, dtype=object)
+    multipoint = shapely.multipoints(points)
+    try:
+        cells = shapely.voronoi_polygons(multipoint, extend_to=envelope, ordered=True)
+        return np.asarray(shapely.get_parts(cells), dtype=object)
+    except (TypeError, UnsupportedGEOSVersionError):
+        pass
+
+    cells = shapely.get_parts(shapely.voronoi_polygons(multipoint, extend_to=envelope))
+    point_idx, cell_idx = shapely.STRtree(cells).query(points, predicate="within")
+    if len(point_idx) != len(points) or len(np.unique(point_idx)) != len(points):
+        raise ValueError(f"Voronoi labelling matched {len(np.unique(point_idx))} of {len(points)} stations")
+    labelled = np.empty(len(points), dtype=object)
+    labelled[point_idx] = cells[cell_idx]
+    return labelled
+
+def input_hashes():
+    """{input: hash} for everything the regions are built from."""
+    hashes = {path: file_hash(path) for path in SITES_GEOJSONS + [MAPPING_FILE, MASK_GPKG]}
+    # Port tables, ghosts, bbox and exclusions defined in code / networks.json
+    tables = json.dumps({
+        "colors": PORT_COLORS,
+        "names": PORT_NAMES,
+        "ports": SPECIFIC_PORTS,
+        "ghosts": GHOST_STATIONS,
+        "bands": [BAND_BREAKPOINTS, BAND_PORTS],
+        "bbox": BBOX_BOUNDS,
+        "grid_size": DISSOLVE_GRID_SIZE,
+        "excluded": sorted(registry().excluded),
+    }, sort_keys=True)
+    hashes["port_tables"] = hashlib.sha256(tables.encode('utf-8')).hexdigest()
+    # The build code itself (simplify tolerance, clipping...)
+    hashes["script"] = file_hash(os.path.abspath(__file__))
+    hashes["port_mask"] = file_hash(os.path.abspath(port_mask.__file__))
+    return hashes
+
+def is_up_to_date(hashes):
+    """True if the last build used exactly these inputs and its outputs are still there."""
     try:
-        gdf_global = gpd.read_file(GLOBAL_GEOJSON)
-        gdf_linz = gpd.read_file(LINZ_GEOJSON)
-    except Exception as e:
-        print(f"Error loading GeoJSON files: {e}")
-        print("Please check that the files exist in 'app/data/'.")
+        with open(MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (manifest.get('inputs') == hashes
+            and all(os.path.exists(p) for p in (OUTPUT_GPKG, OUTPUT_WEB_GEOJSON, OUTPUT_PORT_TABLE)))
+
+def save_manifest(hashes):
+    write_json_atomic(MANIFEST_FILE, {"inputs": hashes}, indent=4, sort_keys=True)
+
+def main():
+    hashes = input_hashes()
+    if not FORCE_BUILD and is_up_to_date(hashes):
+        print(f"Inputs unchanged since the last build ({MANIFEST_FILE}). Nothing to do.")
         return
 
-    # Combine datasets
-    print(" combining datasets...")
-    stations = pd.concat([gdf_global, gdf_linz], ignore_index=True)
-    
-    # Filter Excluded Stations
-    print(f"Filtering excluded stations: {EXCLUDED_STATIONS}")
-    # Ensure Site Code column exists and is normalized
-    if 'Site Code' in stations.columns:
-        stations = stations[~stations['Site Code'].str.upper().isin(EXCLUDED_STATIONS)]
+    if build_regions():
+        save_manifest(hashes)
+        print(f"Manifest saved to {MANIFEST_FILE}")
+
+def build_regions():
+    """Builds and saves the port regions. Returns False if the build failed or fell back to unclipped."""
+    import geopandas as gpd
+    import pandas as pd
+    from shapely.geometry import box, Point
+
+    # Both GeoJSONs, aliases (GSMG -> GSM2) and exclusions are handled by the registry
+    print("Loading station data...")
+    sites = [s for s in registry() if s.lat is not None]
+    if not sites:
+        print("Error: No stations loaded. Please check that the GeoJSON files exist in 'app/data/'.")
+        return False
+    print(f"Excluded stations: {sorted(registry().excluded)}")
+    stations = gpd.GeoDataFrame(
+        {'Site Code': [s.code for s in sites]},
+        geometry=[Point(s.lon, s.lat) for s in sites],
+        crs="EPSG:4326",
+    )
     
-    # --- Ghost Stations (User requested to define borders) ---
-    # These force the Voronoi polygons to extend into empty areas.
     print("Adding Ghost Stations for boundary definition...")
-    GHOST_STATIONS = [
-        # "Between Haas and Hoki" - approx Westland/Main Divide
-        # {'Site Code': 'GHOST_WEST', 'geometry': Point(170.0, -43.3), 'port': 4802},
-        # Cook Strait Fix: Cape Koamaru (Marlborough Sounds Tip) -> Nelson (4802)
-        # Pushes Wellington (Red) back to North Island
-        {'Site Code': 'GHOST_KOAMARU', 'geometry': Point(174.383, -41.116), 'port': 4802}
-    ]
-    
-    ghosts_gdf = gpd.GeoDataFrame(GHOST_STATIONS, crs="EPSG:4326")
+    ghosts_gdf = gpd.GeoDataFrame(
+        [{'Site Code': g['Site Code'], 'port': g['port']} for g in GHOST_STATIONS],
+        geometry=[Point(g['lon'], g['lat']) for g in GHOST_STATIONS],
+        crs="EPSG:4326",
+    )
     
     # We append them to the STATIONS used for generation, 
     # BUT they won't appear in the final web map JSON because 
@@ -200,62 +312,66 @@ def main():
 
     print(f"Total stations (including ghosts): {len(stations)}")
 
-    # Prepare points for Voronoi
-    points = MultiPoint(stations.geometry.tolist())
-    
+    # Prepare points for Voronoi: one per distinct location, first station there owns the cell
+    xs, ys = stations.geometry.x.to_numpy(), stations.geometry.y.to_numpy()
+    first, location = unique_locations(xs, ys)
+    ports = assign_ports(stations['Site Code'], ys)
+    for i in np.flatnonzero(np.bincount(location) > 1):
+        group = np.flatnonzero(location == i)
+        codes = ", ".join(f"{stations['Site Code'].iloc[j]} ({ports[j]})" for j in group)
+        print(f"Warning: Coincident stations share one cell, using the first: {codes}")
+
     print("Generating Voronoi diagram...")
-    regions = voronoi_diagram(points, envelope=BBOX)
+    cells = voronoi_cells(stations.geometry.to_numpy()[first], box(*BBOX_BOUNDS))
     
-    # regions is a GeometryCollection of Polygons.
+    # Cells are labelled by input order, no spatial join needed
     print("Mapping regions to stations...")
-    regions_gdf = gpd.GeoDataFrame(geometry=list(regions.geoms), crs=stations.crs)
-    
-    # Spatial join: Assign station attributes to the region containing it
-    joined = gpd.sjoin(regions_gdf, stations, how="inner", predicate="contains")
+    joined = gpd.GeoDataFrame(
+        {'Site Code': stations['Site Code'].to_numpy()[first]},
+        geometry=list(cells),
+        crs=stations.crs,
+    )
     
-    # Calculate Port for each region
+    # Port for each region (from the station's latitude, not the cell's)
     print("Assigning ports...")
-    joined['port'] = joined.apply(
-        lambda row: get_port_for_station(row['Site Code'], row.geometry.centroid.y), 
-        axis=1
-    )
+    joined['port'] = ports[first]
     
     # Add metadata
     joined['port_name'] = joined['port'].map(PORT_NAMES)
     joined['color'] = joined['port'].map(PORT_COLORS)
     
-    # Dissolve by Port (Unclipped first)
-    print("Dissolving by Port (Unclipped)...")
-    dissolved = joined.dissolve(by='port', aggfunc='first') 
-    dissolved = dissolved.reset_index()
-    
     # --- Masking / Clipping ---
+    # Cells are clipped before the dissolve: most are fully inland or fully
+    # offshore and skip the intersection (port_mask.clip_to_mask fast paths)
+    complete = True
     if os.path.exists(MASK_GPKG):
         print(f"Loading Mask from {MASK_GPKG}...")
         try:
-            mask_gdf = gpd.read_file(MASK_GPKG)
-            if mask_gdf.crs.to_epsg() != 4326:
-                print("Reprojecting mask to EPSG:4326...")
-                mask_gdf = mask_gdf.to_crs(epsg=4326)
-            
-            print("Dissolving mask...")
-            mask_geom = mask_gdf.dissolve().geometry.iloc[0]
+            mask_geom = load_mask(MASK_GPKG)
             
             print("Clipping regions to mask...")
-            # Ideally use gpd.clip, but fallback to intersection if needed for complex geoms
-            clipped = gpd.clip(dissolved, mask_geom)
-            
-            # Clean up empty geometries if any
-            clipped = clipped[~clipped.is_empty]
+            clipped = joined.copy()
+            clipped['geometry'] = clip_to_mask(joined.geometry.to_numpy(), mask_geom)
             
-            final_gdf = clipped[['port', 'port_name', 'color', 'geometry']]
+            # Clean up empty geometries (cells entirely offshore)
+            joined = clipped[~clipped.is_empty]
             print("Clipping complete.")
         except Exception as e:
             print(f"Error during masking: {e}. Using unclipped regions.")
-            final_gdf = dissolved[['port', 'port_name', 'color', 'geometry']]
+            complete = False # build again next run
     else:
         print(f"Mask file not found at {MASK_GPKG}. Using unclipped regions.")
-        final_gdf = dissolved[['port', 'port_name', 'color', 'geometry']]
+    
+    # Dissolve by Port (the cells tile without overlaps: coverage union per port)
+    print("Dissolving by Port...")
+    dissolved = joined.drop(columns='geometry').groupby('port', as_index=False).first()
+    dissolved = gpd.GeoDataFrame(
+        dissolved,
+        geometry=[coverage_dissolve(joined.geometry[joined['port'] == port], DISSOLVE_GRID_SIZE)
+                  for port in dissolved['port']],
+        crs=joined.crs,
+    )
+    final_gdf = dissolved[['port', 'port_name', 'color', 'geometry']]
     
     # Simplify geometry to reduce file size (10MB -> ~500KB)
     print("Simplifying geometries...")
@@ -279,8 +395,12 @@ def main():
         os.remove(OUTPUT_WEB_GEOJSON)
         
     final_gdf.to_file(OUTPUT_WEB_GEOJSON, driver="GeoJSON")
+
+    print(f"Saving port table to {OUTPUT_PORT_TABLE}...")
+    export_port_table()
     
     print("Success.")
+    return complete
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,219 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from atomic_io import write_json_atomic
+from check_api_status import api_client, build_api_map, get_sites, META_FILE
+from inspect_swagger import get_endpoints, SWAGGER_FILE
+from networks import load_networks
+from stations import read_json, read_meta
+
+# Bulk per-site detail fetcher.
+# /sites only gives 'connected' and 'receivingData'; the richer per-site data
+# (receiver, satellite tracking, data rates) needs one call per site and endpoint.
+# Every enabled network's API (networks.json) is queried with its own client and
+# rate limit; calls run concurrently, use conditional requests (ETag /
+# Last-Modified) so unchanged details cost a 304, and are merged into
+# station_meta.json in one pass (field "api_details").
+# station_meta.json is published with the map, so only DETAIL_FIELDS are kept
+# there; the raw bodies only live in the (git-ignored) DETAIL_CACHE_FILE.
+
+# Configuration
+MAX_WORKERS = int(os.environ.get("SBC_DETAIL_WORKERS", "8"))
+MAX_RPS = float(os.environ.get("SBC_DETAIL_MAX_RPS", "20")) # requests/second per network API
+DETAIL_CACHE_FILE = ".sbc_detail_cache.json" # ETag/Last-Modified + last body per URL
+
+# api_details field -> keys that may hold it in a detail response (first match wins, any case)
+DETAIL_FIELDS = {
+    'receiver': ['receiverType', 'receiver', 'receiverName'],
+    'satellites': ['trackedSatellites', 'satellitesTracked', 'satellites', 'numSatellites'],
+    'data_rate_bps': ['dataRateBps', 'dataRate', 'bitRate'],
+}
+
+# Used when swagger.json isn't available
+DEFAULT_SITE_ENDPOINTS = ["/sites/{siteId}"]
+
+class RateLimiter:
+    """Simple thread-safe pacing: at most 'rate' acquisitions per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+def site_endpoints():
+    """
+    Per-site GET endpoints from the swagger document (via inspect_swagger.py):
+    anything under /sites/ with exactly one path parameter.
+    """
+    if not os.path.exists(SWAGGER_FILE):
+        print(f"{SWAGGER_FILE} not found. Using default endpoints: {DEFAULT_SITE_ENDPOINTS}")
+        return DEFAULT_SITE_ENDPOINTS
+
+    endpoints = []
+    for path, _ in get_endpoints(SWAGGER_FILE):
+        if path.lower().startswith("/sites/") and len(re.findall(r"\{[^}]+\}", path)) == 1:
+            endpoints.append(path)
+    return endpoints or DEFAULT_SITE_ENDPOINTS
+
+def endpoint_key(template):
+    """'/sites/{siteId}/receiver' -> 'receiver', '/sites/{siteId}' -> 'site'."""
+    parts = [p for p in template.strip("/").split("/") if not p.startswith("{")]
+    return "_".join(parts[1:]) or "site"
+
+
+def curate_details(bodies):
+    """
+    The DETAIL_FIELDS found in a site's detail bodies: receiver type (str),
+    tracked satellites (int, or {constellation: int}) and data rate (number).
+    """
+    details = {}
+    for body in bodies:
+        if not isinstance(body, dict):
+            continue
+        lowered = {k.lower(): v for k, v in body.items()}
+        for field, keys in DETAIL_FIELDS.items():
+            value = next((lowered[k.lower()] for k in keys if lowered.get(k.lower()) is not None), None)
+            if field in details or value is None:
+                continue
+            if field == 'receiver' and isinstance(value, str):
+                details[field] = value.strip()
+            elif field == 'satellites' and isinstance(value, dict):
+                details[field] = {str(k): v for k, v in value.items() if isinstance(v, int) and not isinstance(v, bool)}
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                details[field] = value
+    return details
+
+def network_jobs(network, endpoints):
+    """(client, [(code, path)]) for one network's API sites, or None if it's unavailable."""
+    client = api_client(network)
+    if not client.ensure_token():
+        print(f"[{network.name}] Failed to login to API.")
+        client.close()
+        return None
+    sites = get_sites(client)
+    if not sites:
+        print(f"[{network.name}] No sites returned from API.")
+        client.close()
+        return None
+    jobs = []
+    for code, site in build_api_map(sites, network).items():
+        site_id = site.get('id', code)
+        for template in endpoints:
+            jobs.append((code, re.sub(r"\{[^}]+\}", str(site_id), template)))
+    print(f"[{network.name}] {len(sites)} sites.")
+    return client, jobs
+
+def fetch_detail(client, limiter, path, cached):
+    """
+    One conditional GET. Returns (status, body, validators) where status is
+    'fresh', 'unchanged' (304, body from cache) or 'error'.
+    """
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    limiter.acquire()
+    try:
+        response = client.get(path, headers=headers)
+    except Exception as e:
+        return 'error', str(e), None
+
+    if response.status_code == 304 and cached:
+        return 'unchanged', cached.get('body'), cached
+    if response.status_code != 200:
+        return 'error', f"Status {response.status_code}", None
+
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'body': body,
+    }
+    return 'fresh', body, validators
+
+def main():
+    networks = [n for n in load_networks() if n.has_api]
+    endpoints = site_endpoints()
+    meta = read_meta(META_FILE)
+    cache = read_json(DETAIL_CACHE_FILE, {})
+
+    # Only sites we show on the map (station_meta.json codes); a code on several
+    # networks is fetched from the first one in networks.json order
+    jobs = []
+    clients = []
+    seen = set()
+    for network in networks:
+        result = network_jobs(network, endpoints)
+        if result is None:
+            continue
+        client, site_jobs = result
+        clients.append(client)
+        limiter = RateLimiter(MAX_RPS)
+        codes = {code for code, _ in site_jobs if code in meta and code not in seen}
+        seen |= codes
+        jobs.extend((code, client, limiter, path) for code, path in site_jobs if code in codes)
+
+    if not clients:
+        print("CRITICAL: No network API answered. Aborting.")
+        exit(1)
+
+    print(f"Fetching {len(jobs)} detail calls ({len(endpoints)} endpoints x {len(seen)} sites), "
+          f"{MAX_WORKERS} workers, max {MAX_RPS} req/s per network...")
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = [
+            (code, url, pool.submit(fetch_detail, client, limiter, path, cache.get(url)))
+            for code, client, limiter, path in jobs
+            for url in [f"{client.base_url}{path}"]
+        ]
+        results = [(code, url, f.result()) for code, url, f in futures]
+    for client in clients:
+        client.close()
+
+    # Merge everything in one pass
+    counts = {'fresh': 0, 'unchanged': 0, 'error': 0}
+    bodies = {}
+    for code, url, (status, body, validators) in results:
+        counts[status] += 1
+        if status == 'error':
+            print(f"  {code} {url}: {body}")
+            continue
+        if validators:
+            cache[url] = validators
+        bodies.setdefault(code, []).append(body)
+
+    # Re-read so fields written by other scripts while we were fetching aren't lost
+    meta = read_meta(META_FILE)
+    checked = datetime.now().strftime("%Y-%m-%d %H:%M")
+    for code, code_bodies in bodies.items():
+        if code in meta:
+            meta[code]['api_details'] = dict(curate_details(code_bodies), checked=checked)
+
+    write_json_atomic(META_FILE, meta, indent=4, sort_keys=True)
+    write_json_atomic(DETAIL_CACHE_FILE, cache)
+
+    print(f"Done in {time.monotonic() - start:.1f}s: {counts['fresh']} updated, "
+          f"{counts['unchanged']} unchanged (304), {counts['error']} errors.")
+    print(f"Saved {len(bodies)} stations' details to {META_FILE}")
+
+if __name__ == "__main__":
+    main()
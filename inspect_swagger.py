@@ -1,17 +1,28 @@
 import json
 
-try:
-    with open('swagger.json', 'r', encoding='utf-8') as f:
+SWAGGER_FILE = 'swagger.json'
+
+def get_endpoints(path=SWAGGER_FILE, method='GET'):
+    """Returns [(path, summary)] for every operation of 'method' in the swagger document."""
+    with open(path, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    print("Swagger Version:", data.get('swagger', data.get('openapi', '')))
-    print("Base Path:", data.get('basePath'))
-    print("Servers:", data.get('servers'))
-    
-    paths = data.get('paths', {})
-    for path, methods in paths.items():
-        for method, details in methods.items():
-            if method.upper() == 'GET':
-                 summary = details.get('summary', '')
-                 print(f"{method.upper()} {path}: {summary}")
-except Exception as e:
-    print(e)
+
+    endpoints = []
+    for api_path, methods in data.get('paths', {}).items():
+        for m, details in methods.items():
+            if m.upper() == method.upper():
+                endpoints.append((api_path, details.get('summary', '')))
+    return endpoints
+
+if __name__ == "__main__":
+    try:
+        with open(SWAGGER_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        print("Swagger Version:", data.get('swagger', data.get('openapi', '')))
+        print("Base Path:", data.get('basePath'))
+        print("Servers:", data.get('servers'))
+        
+        for path, summary in get_endpoints(SWAGGER_FILE):
+            print(f"GET {path}: {summary}")
+    except Exception as e:
+        print(e)
@@ -1,34 +1,16 @@
-import requests
-import json
 from datetime import datetime
 
-# Configuration
-BASE_URL = "https://smartfix.co.nz/SBC/API"
-TOKEN = "jqgVbuhB9o9IqkYni3cKEMF9kuzPZMmOBHjXu8Fm2uAjloYqLQbB9PA7hIVtRezHY42Pxk265acdjsb8JQ1h5wDQhkd6DPx8R3NFhK2SL2vQ661K1yrcpZBfihNyW6ZhLFil5zhq6kRrXzKGff9VPj1fkOFqz5qV5uF7XUbMwYfwG8JjN9Jmgw7y6dO7NSLsNWe3XkeFJ1bTQn7redUCrDpvWz2KahIaQP13HYU2vNlEXAuUciYC60lLr69KNZmh"
-
-HEADERS = {
-    "X-SBC-Auth": TOKEN,
-    "Accept": "application/json"
-}
+from smartfix_api import SmartFixClient
 
 def get_station_status():
-    url = f"{BASE_URL}/sites"
-    print(f"Querying {url}...")
+    # Shared client: cached session token, re-login on 401, pagination handled
+    client = SmartFixClient()
+    print(f"Querying {client.base_url}/sites...")
     
     try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
+        sites = client.get_sites()
         
-        if response.status_code == 200:
-            data = response.json()
-            # Handle response structure (dictionary with 'sites' key or list)
-            if isinstance(data, dict) and 'sites' in data:
-                sites = data['sites']
-            elif isinstance(data, list):
-                sites = data
-            else:
-                print("Unexpected JSON structure.")
-                return
-
+        if sites is not None:
             print(f"Total Sites Found: {len(sites)}")
             print("-" * 60)
             print(f"{'Site Code':<10} | {'Connected':<10} | {'Receiving':<10} | {'Status'}")
@@ -62,7 +44,7 @@ def get_station_status():
             print(f"Summary: {online_count} Online, {offline_count} Offline")
             
         else:
-            print(f"Error: {response.status_code} - {response.text}")
+            print("Error: Could not retrieve sites.")
             
     except Exception as e:
         print(f"Exception: {e}")
@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local mock of the SBC REST API (v12.0) for offline benchmarking and
+# regression tests of the status pipeline.
+#
+# Covers: POST /login (lowercase + legacy capitalised payloads), X-SBC-Auth
+# validation with token expiry (401), GET /sites with thousands of sites,
+# optional pagination, slow responses and random server errors.
+# Per-site details (GET /sites/{id}, /sites/{id}/receiver) support ETag /
+# Last-Modified conditional requests, and GET /swagger.json lists them.
+#
+# Example:
+#   python mock_sbc_api.py --sites 5000 --token-ttl 60 --delay 200 --page-size 500
+#   SMARTFIX_API_URL=http://127.0.0.1:8081/SBC/API/v12.0 SMARTFIX_USER=Admin SMARTFIX_PASSWORD=test python check_api_status.py
+#
+# Any path prefix is accepted (/SBC/API/v12.0/sites, /SBC/API/sites, /sites).
+
+META_FILE = "app/data/station_meta.json"
+
+SWAGGER = {
+    'swagger': '2.0',
+    'basePath': '/SBC/API/v12.0',
+    'paths': {
+        '/login': {'post': {'summary': 'Login and get a session token'}},
+        '/sites': {'get': {'summary': 'List sites with connection status'}},
+        '/sites/{siteId}': {'get': {'summary': 'Site details'}},
+        '/sites/{siteId}/receiver': {'get': {'summary': 'Receiver, tracking and data rate details'}},
+    },
+}
+
+
+def base36(n, width):
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    out = ""
+    for _ in range(width):
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+    return out
+
+
+def build_sites(count):
+    """Real station codes from station_meta.json first, then synthetic 'Q' + base36 codes."""
+    codes = []
+    if os.path.exists(META_FILE):
+        with open(META_FILE, "r") as f:
+            codes = sorted(json.load(f).keys())
+    codes = codes[:count]
+    i = 0
+    while len(codes) < count:
+        codes.append('Q' + base36(i, 3))
+        i += 1
+    return [{'id': n + 1, 'siteCode': code, 'name': code} for n, code in enumerate(codes)]
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.sites = build_sites(args.sites)
+        self.tokens = {} # token -> expiry (time.time())
+        self.lock = threading.Lock()
+        self.by_key = {str(s['id']): s for s in self.sites}
+        self.by_key.update({s['siteCode']: s for s in self.sites})
+        self.started = formatdate(time.time(), usegmt=True) # details 'last modified'
+        self.stats = {'logins': 0, 'sites_requests': 0, 'detail_requests': 0, 'not_modified': 0,
+                      'unauthorized': 0, 'errors': 0}
+
+    def issue_token(self):
+        token = secrets.token_urlsafe(48)
+        with self.lock:
+            self.tokens[token] = time.time() + self.args.token_ttl
+            self.stats['logins'] += 1
+        return token
+
+    def token_valid(self, token):
+        with self.lock:
+            expiry = self.tokens.get(token)
+            if expiry is None:
+                return False
+            if time.time() > expiry:
+                del self.tokens[token]
+                return False
+            return True
+
+    def site_detail(self, site, kind):
+        """Static per-site detail documents (so repeat requests can be answered 304)."""
+        if kind == 'receiver':
+            return {
+                'siteCode': site['siteCode'],
+                'receiverType': 'SEPT POLARX5',
+                'firmware': '5.5.0',
+                'trackedSatellites': {'GPS': 10, 'GLONASS': 7, 'Galileo': 8, 'BeiDou': 9},
+                'dataRateBps': 2400 + site['id'] % 600,
+            }
+        return dict(site, cluster='Mock Cluster', latitude=-41.0, longitude=174.0)
+
+    def site_status(self, site):
+        """Live flags for one site (re-rolled every request, so flapping shows up)."""
+        offline = random.random() < self.args.offline_rate
+        return dict(site, connected=not offline or random.random() < 0.5, receivingData=not offline)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "MockSBC/12.0"
+    state = None # set in main()
+
+    def log_message(self, format, *args):
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def simulate_conditions(self):
+        """Slow response + random 500s. Returns False if an error was sent."""
+        args = self.state.args
+        if args.delay or args.jitter:
+            time.sleep((args.delay + random.uniform(0, args.jitter)) / 1000)
+        if random.random() < args.error_rate:
+            self.state.stats['errors'] += 1
+            self.send_json(500, {'message': 'Internal Server Error (simulated)'})
+            return False
+        return True
+
+    def endpoint(self):
+        return urlparse(self.path).path.rstrip('/').rsplit('/', 1)[-1].lower()
+
+    def do_POST(self):
+        if not self.simulate_conditions():
+            return
+        if self.endpoint() != 'login':
+            self.send_json(404, {'message': 'Not Found'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {'message': 'Invalid JSON'})
+            return
+
+        username = body.get('username', body.get('Username'))
+        password = body.get('password', body.get('Password'))
+        args = self.state.args
+        if args.legacy_only and 'Username' not in body:
+            self.send_json(400, {'message': 'Username is required'})
+            return
+        if username != args.user or (args.password is not None and password != args.password):
+            self.send_json(401, {'message': 'Invalid credentials'})
+            return
+
+        token = self.state.issue_token()
+        self.send_json(200, {'token': token, 'expiresIn': args.token_ttl}, {'X-SBC-Auth': token})
+
+    def do_GET(self):
+        if not self.simulate_conditions():
+            return
+        if self.endpoint() == 'swagger.json':
+            self.send_json(200, SWAGGER)
+            return
+
+        # /sites, /sites/{id}, /sites/{id}/receiver
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if 'sites' not in [p.lower() for p in parts]:
+            self.send_json(404, {'message': 'Not Found'})
+            return
+        tail = parts[[p.lower() for p in parts].index('sites') + 1:]
+
+        token = self.headers.get('X-SBC-Auth', '').strip('"')
+        if not self.state.token_valid(token):
+            self.state.stats['unauthorized'] += 1
+            self.send_json(401, {'message': 'Session expired or invalid token'})
+            return
+
+        if tail:
+            self.send_site_detail(tail)
+            return
+
+        self.state.stats['sites_requests'] += 1
+        sites = self.state.sites
+        query = parse_qs(urlparse(self.path).query)
+        page_size = int(query.get('pageSize', [self.state.args.page_size or 0])[0])
+        if page_size:
+            page = int(query.get('page', ['1'])[0])
+            start = (page - 1) * page_size
+            chunk = [self.state.site_status(s) for s in sites[start:start + page_size]]
+            total_pages = max(1, -(-len(sites) // page_size))
+            self.send_json(200, {
+                'sites': chunk,
+                'page': page,
+                'pageSize': page_size,
+                'totalCount': len(sites),
+                'totalPages': total_pages,
+                'nextPage': page + 1 if page < total_pages else None,
+            })
+        else:
+            self.send_json(200, {'sites': [self.state.site_status(s) for s in sites]})
+
+    def send_site_detail(self, tail):
+        site = self.state.by_key.get(tail[0])
+        kind = tail[1].lower() if len(tail) > 1 else 'site'
+        if site is None or kind not in ('site', 'receiver'):
+            self.send_json(404, {'message': 'Not Found'})
+            return
+
+        self.state.stats['detail_requests'] += 1
+        body = self.state.site_detail(site, kind)
+        etag = '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()[:16] + '"'
+        last_modified = self.state.started
+
+        if self.headers.get('If-None-Match') == etag or (
+                'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified):
+            self.state.stats['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_json(200, body, {'ETag': etag, 'Last-Modified': last_modified})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock SBC REST API (v12.0)")
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--sites", type=int, default=3000, help="Number of sites returned by /sites")
+    parser.add_argument("--user", default="Admin")
+    parser.add_argument("--password", default=None, help="Required password (default: accept any)")
+    parser.add_argument("--legacy-only", action="store_true", help="Only accept the capitalised login payload")
+    parser.add_argument("--token-ttl", type=float, default=3600, help="Token lifetime, seconds (then 401)")
+    parser.add_argument("--page-size", type=int, default=0, help="Force pagination of /sites (0 = off)")
+    parser.add_argument("--delay", type=float, default=0, help="Added response delay, ms")
+    parser.add_argument("--jitter", type=float, default=0, help="Random extra delay up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered 500")
+    parser.add_argument("--offline-rate", type=float, default=0.05, help="Fraction of sites reported offline")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    Handler.state = MockState(args)
+    httpd = ThreadingHTTPServer((args.bind, args.port), Handler)
+    print(f"Mock SBC API on http://{args.bind}:{args.port}/SBC/API/v12.0 "
+          f"({args.sites} sites, token TTL {args.token_ttl}s, page size {args.page_size or 'off'})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nMock stopped. Stats: " + ", ".join(f"{k}={v}" for k, v in Handler.state.stats.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import json
+import os
+
+# Caster / API networks (networks.json).
+# Each network has its own caster host + ports + credentials + concurrency
+# limits and its own SBC API. Credentials are never in the file: only the
+# names of the environment variables holding them.
+# 'excluded_stations' only apply to that network's streams / API sites; scripts
+# check them through stations.registry().is_excluded(code, network), which adds
+# the network-independent exclusions.
+# 'single_ports' / 'network_ports' split the caster ports into single-site
+# and network (multi-station) streams.
+# '*_env' entries (e.g. host_env: NTRIP_HOST) override the value when set, so
+# local runs against ntrip_caster_sim.py / mock_sbc_api.py keep working.
+
+NETWORKS_FILE = os.environ.get("NETWORKS_FILE", "networks.json")
+
+# Used when networks.json is missing (the original single SmartFix setup)
+DEFAULT_CONFIG = {
+    "networks": [{
+        "name": "smartfix",
+        "caster": {"host": "www.smartfix.co.nz", "host_env": "NTRIP_HOST", "ports": "4800-4815",
+                   "single_ports": "4800-4809", "network_ports": "4810-4815",
+                   "user_env": "NTRIP_USER", "password_env": "NTRIP_PASSWORD"},
+        "api": {"base_url": "https://smartfix.co.nz/SBC/API/v12.0", "base_url_env": "SMARTFIX_API_URL",
+                "user_env": "SMARTFIX_USER", "password_env": "SMARTFIX_PASSWORD",
+                "use_default_credentials": True},
+        "excluded_stations": ["TREC", "2GRO", "2GR0", "1778", "7651", "XGRX", "GSMG"],
+    }]
+}
+
+def parse_ports(spec):
+    """'4800-4815,4820' or [4800, 4801] -> [4800, ..., 4815, 4820]."""
+    if isinstance(spec, list):
+        return [int(p) for p in spec]
+    ports = []
+    for part in str(spec).split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-")
+            ports.extend(range(int(start), int(end) + 1))
+        elif part:
+            ports.append(int(part))
+    return ports
+
+def env_or(section, key):
+    """section[key], overridden by the environment variable named in section[key + '_env']."""
+    env_name = section.get(key + "_env")
+    return (os.environ.get(env_name) if env_name else None) or section.get(key)
+
+class Network:
+    def __init__(self, config):
+        self.name = config['name']
+        self.enabled = config.get('enabled', True)
+        self.excluded = {code.upper() for code in config.get('excluded_stations', [])}
+
+        caster = config.get('caster') or {}
+        self.host = env_or(caster, 'host')
+        self.ports = parse_ports(caster.get('ports', ""))
+        # Single-site vs network (multi-station) ports; without a split every port is a single-site port
+        self.network_ports = set(parse_ports(caster.get('network_ports', "")))
+        self.single_ports = (set(parse_ports(caster['single_ports'])) if 'single_ports' in caster
+                             else set(self.ports) - self.network_ports)
+        self.user = env_or(caster, 'user')
+        self.password = env_or(caster, 'password')
+        self.max_concurrency = int(caster.get('max_concurrency', 8)) # sourcetable connections at once
+        self.port_deadline = float(caster.get('port_deadline', 10)) # seconds per port
+        self.probe_concurrency = int(caster.get('probe_concurrency', 16)) # health probes at once (whole host)
+
+        api = config.get('api') or {}
+        self.api_url = env_or(api, 'base_url')
+        self.api_user = env_or(api, 'user')
+        self.api_password = env_or(api, 'password')
+        self.api_token = env_or(api, 'token')
+        self.api_default_credentials = api.get('use_default_credentials', False)
+
+    @property
+    def has_caster(self):
+        return bool(self.host and self.ports)
+
+    @property
+    def has_api(self):
+        return bool(self.api_url)
+
+    def is_excluded(self, code):
+        """Raw station code (before stations.ALIASES) on this network's exclusion list."""
+        return str(code).strip().upper() in self.excluded
+
+    def __repr__(self):
+        return f"Network({self.name!r}, caster={self.host}, api={self.api_url})"
+
+def load_networks(path=NETWORKS_FILE, include_disabled=False):
+    """Networks from networks.json in config order (the first one is the primary network)."""
+    config = DEFAULT_CONFIG
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                config = json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load {path} ({e}). Using the default SmartFix network.")
+
+    networks = [Network(c) for c in config.get('networks', [])]
+    return [n for n in networks if include_disabled or n.enabled]
+
+def network_by_name(networks, name):
+    for network in networks:
+        if network.name == name:
+            return network
+    return None
+
+def station_networks(meta, networks):
+    """{code: Network} using the first network listed in meta[code]['networks'] (primary otherwise)."""
+    primary = networks[0] if networks else None
+    result = {}
+    for code, data in meta.items():
+        names = data.get('networks') or []
+        result[code] = next((n for n in networks if n.name in names), primary)
+    return result
@@ -0,0 +1,344 @@
+import asyncio
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import socket
+import struct
+import time
+
+from check_station_health import ELLIPSOID_A, ELLIPSOID_F
+from mock_sbc_api import base36
+from networks import parse_ports
+from rtcm_frames import (build_frame, GPS_EPOCH_UNIX, GPS_UTC_LEAP_SECONDS, BDS_GPS_OFFSET,
+                         GLONASS_UTC_OFFSET, WEEK_MS, DAY_MS)
+
+# Local NTRIP caster stand-in for load and regression testing.
+#
+# Serves a sourcetable on every port (like www.smartfix.co.nz:4800-4815) and
+# streams synthetic, CRC-valid RTCM3 (MSM7 for GPS/GLONASS/Galileo/BeiDou +
+# 1005) per mountpoint. Faults can be injected per connection: latency,
+# stalls, resets, auth failures and corrupt frames.
+#
+# Example (10x the real network, some faults), then point the tools at it:
+#   python ntrip_caster_sim.py --scale 10 --stall-rate 0.05 --reset-rate 0.05 --bad-frame-rate 0.01
+#   NTRIP_HOST=127.0.0.1 NTRIP_USER=test NTRIP_PASSWORD=test python check_ntrip_ports.py
+#   NTRIP_HOST=127.0.0.1 NTRIP_USER=test NTRIP_PASSWORD=test python check_station_health.py
+#
+# NOTE: Both scripts write to app/data/ - run them from a scratch copy when benchmarking.
+
+META_FILE = "app/data/station_meta.json"
+STATION_GEOJSONS = [
+    "app/data/Sites_20250725_Global.geojson",
+    "app/data/Sites_20250725_LINZ.geojson",
+]
+MOUNTPOINT_SUFFIX = "singleADV4" # check_station_health.build_stream_request() convention
+
+# Constellation -> (MSM7 message type, typical sats tracked, signals)
+CONSTELLATIONS = [
+    ('GPS', 1077, 10, 2),
+    ('GLONASS', 1087, 7, 2),
+    ('Galileo', 1097, 8, 2),
+    ('BeiDou', 1127, 9, 2),
+]
+ARP_INTERVAL = 5 # seconds between 1005 messages
+
+def geodetic_to_ecef(lat, lon, height):
+    e2 = ELLIPSOID_F * (2 - ELLIPSOID_F)
+    lat_r, lon_r = math.radians(lat), math.radians(lon)
+    n = ELLIPSOID_A / math.sqrt(1 - e2 * math.sin(lat_r) ** 2)
+    return (
+        (n + height) * math.cos(lat_r) * math.cos(lon_r),
+        (n + height) * math.cos(lat_r) * math.sin(lon_r),
+        (n * (1 - e2) + height) * math.sin(lat_r),
+    )
+
+def pack_bits(fields):
+    """Packs [(value, n_bits), ...] MSB first into bytes (zero padded to a whole byte)."""
+    value = 0
+    total = 0
+    for field, n_bits in fields:
+        value = (value << n_bits) | (field & ((1 << n_bits) - 1))
+        total += n_bits
+    pad = -total % 8
+    return (value << pad).to_bytes((total + pad) // 8, 'big')
+
+# --- Synthetic Messages ---
+
+def msm_epoch(name, now):
+    """MSM epoch time field for 'now' (Unix time) in the constellation's time scale."""
+    gps_ms = int((now - GPS_EPOCH_UNIX + GPS_UTC_LEAP_SECONDS) * 1000)
+    if name == 'GLONASS':
+        glo_ms = int((now + GLONASS_UTC_OFFSET) * 1000)
+        day_of_week = (glo_ms // DAY_MS + 4) % 7 # 1970-01-01 was a Thursday (0 = Sunday)
+        return (day_of_week << 27) | (glo_ms % DAY_MS)
+    if name == 'BeiDou':
+        return (gps_ms - BDS_GPS_OFFSET * 1000) % WEEK_MS
+    return gps_ms % WEEK_MS
+
+def msm7_frame(msg_type, station_id, epoch, sats, signals, multiple):
+    """MSM7 message: real header + masks, zeroed observables of the correct length."""
+    sat_mask = 0
+    for prn in sats:
+        sat_mask |= 1 << (64 - prn)
+    sig_mask = 0
+    for sig in signals:
+        sig_mask |= 1 << (32 - sig)
+    n_cells = len(sats) * len(signals)
+
+    header = [
+        (msg_type, 12), (station_id, 12), (epoch, 30), (multiple, 1),
+        (0, 3), (0, 7), (0, 2), (0, 2), (0, 1), (0, 3),
+        (sat_mask, 64), (sig_mask, 32), ((1 << n_cells) - 1, n_cells),
+    ]
+    # MSM7 data: 36 bits per satellite, 80 bits per cell
+    body_bits = 36 * len(sats) + 80 * n_cells
+    payload = pack_bits(header + [(0, body_bits)])
+    return build_frame(payload)
+
+def arp_1005_frame(station_id, x, y, z):
+    payload = pack_bits([
+        (1005, 12), (station_id, 12), (0, 6), (1, 1), (1, 1), (1, 1), (0, 1),
+        (round(x / 0.0001), 38), (0, 1), (0, 1),
+        (round(y / 0.0001), 38), (0, 2),
+        (round(z / 0.0001), 38),
+    ])
+    return build_frame(payload)
+
+# --- Station List ---
+
+def load_stations(scale, ports):
+    """
+    [{code, ports, lat, lon, height, station_id}] from station_meta.json + the
+    station GeoJSONs. scale > 1 adds synthetic copies (codes 'Z' + base36) near
+    each real station, spread over the same ports.
+    """
+    coords = {}
+    for path in STATION_GEOJSONS:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for feature in json.load(f).get('features', []):
+                    props = feature.get('properties', {})
+                    if props.get('Site Code') and props.get('latitude_dd') is not None:
+                        coords[props['Site Code'].upper()] = (
+                            props['latitude_dd'], props['longitude_dd'], props.get('Height') or 0.0)
+
+    meta = {}
+    if os.path.exists(META_FILE):
+        with open(META_FILE, "r") as f:
+            meta = json.load(f)
+
+    base = []
+    for code, data in sorted(meta.items()):
+        station_ports = [p for p in (data.get('port'), data.get('network_port')) if p in ports]
+        if not station_ports:
+            continue
+        lat, lon, height = coords.get(code, (random.uniform(-46, -35), random.uniform(167, 178), 50.0))
+        base.append({'code': code, 'ports': station_ports, 'lat': lat, 'lon': lon, 'height': height})
+
+    if not base:
+        # No repo data - fully synthetic network
+        base = [{'code': base36(i, 3).rjust(4, 'Y'), 'ports': [ports[i % len(ports)]],
+                 'lat': random.uniform(-46, -35), 'lon': random.uniform(167, 178), 'height': 50.0}
+                for i in range(130)]
+
+    stations = list(base)
+    synthetic = 0
+    for _ in range(max(0, scale - 1)):
+        for src in base:
+            stations.append({
+                'code': 'Z' + base36(synthetic, 3),
+                'ports': src['ports'],
+                'lat': src['lat'] + random.uniform(-0.05, 0.05),
+                'lon': src['lon'] + random.uniform(-0.05, 0.05),
+                'height': src['height'],
+            })
+            synthetic += 1
+
+    for i, station in enumerate(stations):
+        station['station_id'] = i % 4096
+        station['ecef'] = geodetic_to_ecef(station['lat'], station['lon'], station['height'])
+    return stations
+
+# --- Caster ---
+
+class CasterSim:
+    def __init__(self, args):
+        self.args = args
+        self.ports = args.ports
+        self.stations = load_stations(args.scale, self.ports)
+        self.by_mountpoint = {}
+        self.by_port = {p: [] for p in self.ports}
+        for station in self.stations:
+            mountpoint = station['code'] + MOUNTPOINT_SUFFIX
+            self.by_mountpoint[mountpoint] = station
+            for port in station['ports']:
+                self.by_port[port].append(station)
+        self.expected_auth = None
+        if args.auth:
+            self.expected_auth = "Basic " + base64.b64encode(args.auth.encode('ascii')).decode('ascii')
+        self.stats = {'connections': 0, 'sourcetables': 0, 'streams': 0,
+                      'auth_failures': 0, 'stalls': 0, 'resets': 0, 'bad_frames': 0}
+
+    def sourcetable(self, port):
+        lines = []
+        for station in self.by_port[port]:
+            lines.append(
+                f"STR;{station['code']}{MOUNTPOINT_SUFFIX};{station['code']};RTCM 3.2;"
+                f"1005(5),1077(1),1087(1),1097(1),1127(1);2;GPS+GLO+GAL+BDS;SIM;NZL;"
+                f"{station['lat']:.2f};{station['lon']:.2f};0;0;sim;none;B;N;9600;")
+        lines.append("ENDSOURCETABLE")
+        return ("\r\n".join(lines) + "\r\n").encode('ascii')
+
+    async def handle(self, reader, writer):
+        self.stats['connections'] += 1
+        port = writer.get_extra_info('sockname')[1]
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=10)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+
+        lines = request.decode('latin-1').split("\r\n")
+        parts = lines[0].split()
+        path = parts[1] if len(parts) > 1 else "/"
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        ntrip_v2 = headers.get('ntrip-version', '').upper() == 'NTRIP/2.0' or headers.get('ntrip-version') == '2.0'
+
+        try:
+            # Response latency (connect -> first byte)
+            if self.args.latency:
+                await asyncio.sleep(self.args.latency / 1000)
+
+            auth_ok = self.expected_auth is None or headers.get('authorization') == self.expected_auth
+            if not auth_ok or random.random() < self.args.auth_fail_rate:
+                self.stats['auth_failures'] += 1
+                writer.write(b"HTTP/1.1 401 Unauthorized\r\nWWW-Authenticate: Basic realm=\"/\"\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                return
+
+            mountpoint = path.lstrip("/")
+            station = self.by_mountpoint.get(mountpoint)
+            if station is None or port not in station['ports']:
+                await self.send_sourcetable(writer, port, ntrip_v2)
+                return
+
+            await self.stream(writer, station)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if not writer.is_closing():
+                writer.close()
+
+    async def send_sourcetable(self, writer, port, ntrip_v2):
+        self.stats['sourcetables'] += 1
+        body = self.sourcetable(port)
+        if ntrip_v2:
+            head = b"HTTP/1.1 200 OK\r\nNtrip-Version: Ntrip/2.0\r\nContent-Type: gnss/sourcetable\r\n"
+            if self.args.chunked:
+                writer.write(head + b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+                for i in range(0, len(body), 1024):
+                    chunk = body[i:i + 1024]
+                    writer.write(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+                writer.write(b"0\r\n\r\n")
+            else:
+                writer.write(head + b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+        else:
+            writer.write(b"SOURCETABLE 200 OK\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+        await writer.drain()
+
+    async def stream(self, writer, station):
+        self.stats['streams'] += 1
+        writer.write(b"ICY 200 OK\r\n\r\n")
+        await writer.drain()
+
+        args = self.args
+        stall = random.random() < args.stall_rate
+        reset = random.random() < args.reset_rate
+        fault_at = time.time() + random.uniform(0.5, 3.0)
+        next_arp = 0
+        interval = 1.0 / args.rate
+
+        while True:
+            now = time.time()
+            if (stall or reset) and now >= fault_at:
+                if reset:
+                    self.stats['resets'] += 1
+                    sock = writer.get_extra_info('socket')
+                    if sock is not None:
+                        # SO_LINGER 0 -> RST instead of FIN
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                    writer.transport.abort()
+                    return
+                self.stats['stalls'] += 1
+                await asyncio.sleep(args.stall_seconds) # connection open, nothing sent
+                stall = False
+
+            frames = []
+            if now >= next_arp:
+                frames.append(arp_1005_frame(station['station_id'], *station['ecef']))
+                next_arp = now + ARP_INTERVAL
+
+            # Epoch time lags 'now' by the configured correction latency
+            epoch_time = now - args.epoch_latency / 1000
+            for i, (name, msg_type, n_sats, n_sigs) in enumerate(CONSTELLATIONS):
+                sats = list(range(1, (0 if args.zero_sats else n_sats) + 1))
+                multiple = 1 if i < len(CONSTELLATIONS) - 1 else 0
+                frames.append(msm7_frame(msg_type, station['station_id'], msm_epoch(name, epoch_time),
+                                         sats, list(range(2, 2 + n_sigs)), multiple))
+
+            data = bytearray(b"".join(frames))
+            if args.bad_frame_rate and random.random() < args.bad_frame_rate:
+                # Flip one byte: framer should drop the frame on CRC
+                data[random.randrange(len(data))] ^= 0xFF
+                self.stats['bad_frames'] += 1
+
+            writer.write(data)
+            await writer.drain()
+            await asyncio.sleep(interval)
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.args.report_interval)
+            print("Stats: " + ", ".join(f"{k}={v}" for k, v in self.stats.items()))
+
+    async def run(self):
+        servers = []
+        for port in self.ports:
+            servers.append(await asyncio.start_server(self.handle, self.args.bind, port, backlog=1024))
+        print(f"NTRIP caster simulator: {len(self.stations)} stations on {self.args.bind} "
+              f"ports {self.ports[0]}-{self.ports[-1]}")
+        await asyncio.gather(self.report(), *[s.serve_forever() for s in servers])
+
+def main():
+    parser = argparse.ArgumentParser(description="Local NTRIP caster simulator")
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--ports", type=parse_ports, default=list(range(4800, 4816)), help="e.g. 4800-4815 or 4801,4802")
+    parser.add_argument("--scale", type=int, default=1, help="Multiply the station count (synthetic stations)")
+    parser.add_argument("--auth", default=None, help="Required 'user:password' (default: accept anything)")
+    parser.add_argument("--rate", type=float, default=1.0, help="MSM epochs per second per mountpoint")
+    parser.add_argument("--chunked", action="store_true", help="Chunked transfer encoding for NTRIP 2.0 sourcetables")
+    parser.add_argument("--latency", type=float, default=0, help="Delay before the first response byte, ms")
+    parser.add_argument("--epoch-latency", type=float, default=300, help="MSM epoch age when sent, ms")
+    parser.add_argument("--stall-rate", type=float, default=0, help="Fraction of streams that stall")
+    parser.add_argument("--stall-seconds", type=float, default=30)
+    parser.add_argument("--reset-rate", type=float, default=0, help="Fraction of streams reset (RST) mid-stream")
+    parser.add_argument("--auth-fail-rate", type=float, default=0, help="Fraction of requests answered 401")
+    parser.add_argument("--bad-frame-rate", type=float, default=0, help="Fraction of epochs with a corrupt frame")
+    parser.add_argument("--zero-sats", action="store_true", help="Stream MSM with empty satellite masks")
+    parser.add_argument("--report-interval", type=float, default=10)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(CasterSim(args).run())
+    except KeyboardInterrupt:
+        print("\nSimulator stopped.")
+
+if __name__ == "__main__":
+    main()
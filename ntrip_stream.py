@@ -0,0 +1,159 @@
+"""
+Streaming NTRIP sourcetable reader.
+
+Parses the HTTP/NTRIP response headers, then yields 'STR;' records one at a
+time while bytes arrive, instead of collecting the whole response and
+splitting it after the socket closes. Stops at ENDSOURCETABLE without
+waiting for the caster to close the connection.
+
+Used by check_ntrip_ports.py (serial + async scans) and _archive/debug_sourcetable.py.
+"""
+
+RECV_SIZE = 4096
+# Give up on a response whose header block is larger than this (not a caster)
+MAX_HEADER_SIZE = 16384
+
+
+class SourcetableParser:
+    """
+    Push parser (no socket handling). Feed it raw bytes with feed(), get back
+    the complete 'STR;' records found so far.
+
+    Handles NTRIP 1.0 ("SOURCETABLE 200 OK") and NTRIP 2.0 / HTTP 1.1
+    responses, including 'Transfer-Encoding: chunked'.
+    """
+
+    def __init__(self):
+        self.status_line = None
+        self.status_code = None
+        self.headers = {}
+        self.headers_done = False
+        self.finished = False # True once ENDSOURCETABLE (or a non-200 status) is seen
+        self.chunked = False
+
+        # Undecoded bytes (headers / chunk framing). Reused for the whole response.
+        self._raw = bytearray()
+        # Body bytes not yet split into lines (same buffer as _raw when not chunked)
+        self._body = self._raw
+        self._chunk_remaining = 0
+
+    def feed(self, data):
+        """Adds received bytes. Returns a list of complete 'STR;' record strings."""
+        if self.finished:
+            return []
+
+        self._raw += data
+
+        if not self.headers_done:
+            end = self._raw.find(b"\r\n\r\n")
+            if end < 0:
+                if len(self._raw) > MAX_HEADER_SIZE:
+                    self.finished = True
+                return []
+            self._parse_headers(bytes(self._raw[:end]))
+            del self._raw[:end + 4]
+            if self.finished:
+                return []
+
+        if self.chunked:
+            self._dechunk()
+
+        return self._split_records()
+
+    def _parse_headers(self, block):
+        lines = block.decode('latin-1').split("\r\n")
+        self.status_line = lines[0]
+        parts = self.status_line.split()
+        if len(parts) > 1 and parts[1].isdigit():
+            self.status_code = int(parts[1])
+
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                self.headers[key.strip().lower()] = value.strip()
+
+        self.headers_done = True
+        self.chunked = self.headers.get('transfer-encoding', '').lower() == 'chunked'
+        if self.chunked:
+            self._body = bytearray()
+
+        # Auth failure, mountpoint error, etc. - nothing to parse
+        if self.status_code != 200:
+            self.finished = True
+
+    def _dechunk(self):
+        """Moves chunk payloads from _raw into _body, dropping the chunk-size framing."""
+        raw = self._raw
+        pos = 0
+        while pos < len(raw):
+            if self._chunk_remaining == 0:
+                eol = raw.find(b"\r\n", pos)
+                if eol < 0:
+                    break
+                size_field = raw[pos:eol].split(b";")[0].strip()
+                if not size_field:
+                    # CRLF that terminates the previous chunk
+                    pos = eol + 2
+                    continue
+                size = int(size_field, 16)
+                pos = eol + 2
+                if size == 0:
+                    self.finished = True
+                    break
+                self._chunk_remaining = size
+
+            take = min(self._chunk_remaining, len(raw) - pos)
+            self._body += raw[pos:pos + take]
+            self._chunk_remaining -= take
+            pos += take
+        del raw[:pos]
+
+    def _split_records(self):
+        body = self._body
+        records = []
+        pos = 0
+        while True:
+            eol = body.find(b"\n", pos)
+            if eol < 0:
+                break
+            line = body[pos:eol].rstrip(b"\r")
+            pos = eol + 1
+            if line.startswith(b"STR;"):
+                records.append(line.decode('utf-8', errors='ignore'))
+            elif line.strip() == b"ENDSOURCETABLE":
+                self.finished = True
+                break
+        del body[:pos]
+        return records
+
+
+def iter_sourcetable(sock, parser=None):
+    """
+    Generator: reads from a connected socket (request already sent) into one
+    reused receive buffer and yields 'STR;' records as they arrive.
+    Pass a SourcetableParser to inspect status/headers afterwards.
+    """
+    if parser is None:
+        parser = SourcetableParser()
+
+    buf = bytearray(RECV_SIZE)
+    view = memoryview(buf)
+    while not parser.finished:
+        n = sock.recv_into(buf)
+        if n == 0:
+            break
+        yield from parser.feed(view[:n])
+
+
+async def read_sourcetable_async(reader, parser=None):
+    """asyncio version of iter_sourcetable(). Returns the list of 'STR;' records."""
+    if parser is None:
+        parser = SourcetableParser()
+
+    records = []
+    while not parser.finished:
+        chunk = await reader.read(RECV_SIZE)
+        if not chunk:
+            break
+        records.extend(parser.feed(chunk))
+    return records
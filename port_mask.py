@@ -0,0 +1,188 @@
+import hashlib
+import os
+import sys
+import time
+
+from atomic_io import write_atomic
+
+# Mask build stage + polygon dissolve shared by export_port_regions.py and process_mask_v2.py.
+#
+# A mask source (any polygon layer, e.g. 'Port mask area.gpkg' or the
+# territorial authority GPKG) is read once, reprojected to EPSG:4326,
+# dissolved, repaired and reduced to its polygonal parts. The result is cached
+# as WKB under MASK_CACHE_DIR, keyed by the sha256 of the source file, so the
+# next run (of either script) skips geopandas I/O and the dissolve entirely.
+# load_mask() returns a prepared shapely geometry; clip_to_mask() clips with
+# bounding-box / prepared-predicate fast paths before any real intersection.
+#
+# coverage_dissolve() merges polygons that tile without overlapping (TA
+# boundaries, Voronoi cells) with GEOS's coverage union, which only has to drop
+# the shared edges instead of overlaying every polygon. The result is checked
+# (valid, area preserved); inputs that overlap or whose shared edges don't line
+# up fall back to the generic union.
+#
+# Benchmark: python port_mask.py <polygon layer>   (dissolve() + buffer(0) vs coverage union)
+#
+# geopandas / shapely are imported inside the functions so scripts can import
+# this module (e.g. for file_hash) without paying for them.
+
+# Configuration
+MASK_CACHE_DIR = ".mask_cache"
+
+def file_hash(path):
+    """sha256 of a file's content, None if it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def polygonal(geom):
+    """Only the (Multi)Polygon parts of a geometry (drops slivers that collapsed to lines/points)."""
+    import shapely
+
+    if geom.geom_type in ("Polygon", "MultiPolygon"):
+        return geom
+    parts = [p for p in shapely.get_parts(geom) if p.geom_type in ("Polygon", "MultiPolygon")]
+    return shapely.union_all(parts) if parts else shapely.Polygon()
+
+def coverage_dissolve(geoms, grid_size=None):
+    """
+    Union of polygons. Coverage union when they tile without overlaps, generic
+    union otherwise. 'grid_size' is only used when the edges don't line up:
+    vertices are snapped to that grid and the coverage union retried (removes
+    slivers between neighbours that were clipped separately).
+    """
+    import numpy as np
+    import shapely
+    from shapely.errors import GEOSException
+
+    geoms = np.asarray([g for g in geoms if g is not None and not g.is_empty], dtype=object)
+    if len(geoms) == 0:
+        return shapely.Polygon()
+    total_area = shapely.area(geoms).sum()
+
+    for snap in ([None, grid_size] if grid_size else [None]):
+        parts = shapely.set_precision(geoms, snap) if snap else geoms
+        try:
+            result = shapely.coverage_union_all(parts)
+        except GEOSException:
+            continue # shared edges not noded alike
+        # Overlapping inputs come out as overlapping (invalid) rings or lose area
+        if result.is_valid and abs(result.area - total_area) <= 1e-9 * max(total_area, 1e-12):
+            return polygonal(result)
+        break
+
+    print(f"Dissolve: {len(geoms)} polygons aren't a clean coverage, using generic union.")
+    return polygonal(shapely.union_all(geoms, grid_size=grid_size))
+
+def build_mask(path):
+    """Reads, reprojects, dissolves and validates a mask layer. Returns one shapely geometry."""
+    import geopandas as gpd
+    import shapely
+
+    gdf = gpd.read_file(path)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        print("Reprojecting mask to EPSG:4326...")
+        gdf = gdf.to_crs(epsg=4326)
+
+    print(f"Dissolving {len(gdf)} mask polygons...")
+    parts = [polygonal(g) for g in shapely.make_valid(gdf.geometry.to_numpy())]
+    geom = polygonal(shapely.make_valid(coverage_dissolve(parts)))
+    if geom.is_empty:
+        raise ValueError(f"Mask {path} has no polygon area")
+    return geom
+
+def cache_path(path, source_hash):
+    name = os.path.splitext(os.path.basename(path))[0].replace(" ", "_")
+    return os.path.join(MASK_CACHE_DIR, f"{name}_{source_hash[:16]}.wkb")
+
+def load_mask(path):
+    """
+    The dissolved, validated and prepared mask for a source file (cached WKB
+    when the file hasn't changed). Raises if the file can't be read.
+    """
+    import shapely
+
+    source_hash = file_hash(path)
+    if source_hash is None:
+        raise FileNotFoundError(path)
+    cached = cache_path(path, source_hash)
+
+    geom = None
+    if os.path.exists(cached):
+        try:
+            with open(cached, "rb") as f:
+                geom = shapely.from_wkb(f.read())
+            print(f"Using cached mask {cached}")
+        except Exception as e:
+            print(f"Warning: Could not read mask cache {cached} ({e}). Rebuilding.")
+
+    if geom is None:
+        geom = build_mask(path)
+        os.makedirs(MASK_CACHE_DIR, exist_ok=True)
+        write_atomic(cached, shapely.to_wkb(geom))
+        print(f"Mask cached to {cached}")
+
+    shapely.prepare(geom)
+    return geom
+
+def clip_to_mask(geoms, mask):
+    """
+    Clips an array of polygons to a prepared mask. Returns an object array of
+    (possibly empty) polygonal geometries, same order.
+    Fast paths: bounding box outside the mask's bbox -> empty; disjoint -> empty;
+    fully inside -> unchanged. Only cells crossing the coast are intersected.
+    """
+    import numpy as np
+    import shapely
+
+    geoms = np.asarray(geoms, dtype=object)
+    result = np.array([shapely.Polygon()] * len(geoms), dtype=object)
+
+    xmin, ymin, xmax, ymax = mask.bounds
+    bounds = shapely.bounds(geoms)
+    near = ~((bounds[:, 0] > xmax) | (bounds[:, 2] < xmin) | (bounds[:, 1] > ymax) | (bounds[:, 3] < ymin))
+    near &= shapely.intersects(mask, geoms) # prepared mask
+
+    inside = near & shapely.contains(mask, geoms)
+    result[inside] = geoms[inside]
+
+    crossing = np.flatnonzero(near & ~inside)
+    for i, geom in zip(crossing, shapely.intersection(geoms[crossing], mask)):
+        result[i] = polygonal(geom)
+
+    print(f"Mask clip: {inside.sum()} inside, {len(crossing)} crossing, {len(geoms) - near.sum()} outside.")
+    return result
+
+def benchmark_dissolve(path, repeat=3):
+    """Times the old dissolve() + buffer(0) against coverage_dissolve() on one layer."""
+    import geopandas as gpd
+    import shapely
+
+    gdf = gpd.read_file(path)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    geoms = gdf.geometry.to_numpy()
+    print(f"{path}: {len(gdf)} polygons, {shapely.get_num_coordinates(geoms).sum()} vertices")
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    old_time, old = best(lambda: gdf.dissolve().geometry.buffer(0).iloc[0])
+    new_time, new = best(lambda: coverage_dissolve(geoms))
+    diff = old.symmetric_difference(new).area
+    print(f"  dissolve() + buffer(0): {old_time * 1000:.1f} ms")
+    print(f"  coverage_dissolve():    {new_time * 1000:.1f} ms ({old_time / new_time:.1f}x), "
+          f"area difference {diff:.2e} of {old.area:.4f}")
+
+if __name__ == "__main__":
+    for layer in sys.argv[1:]:
+        benchmark_dissolve(layer)
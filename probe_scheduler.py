@@ -0,0 +1,76 @@
+import heapq
+import os
+import time
+
+from stations import registry
+
+# Adaptive per-station probe scheduler for the RTCM health probe.
+#
+# Instead of probing every station every hour, each station gets its own
+# probe interval from its recent volatility (flaps, Degraded, failed or blind
+# probes) and its importance ('Master in Cell' bases count MASTER_WEIGHT
+# times). Due stations go through a priority queue (most overdue x importance
+# first) and at most PROBE_BUDGET of them are probed per run, so the limited
+# caster connections go where the information is.
+#
+# The time of each probe is kept in station_meta.json as "last_probed" (epoch s).
+
+# Configuration
+MIN_INTERVAL = float(os.environ.get("PROBE_MIN_INTERVAL_H", "0.5")) * 3600 # most volatile stations
+MAX_INTERVAL = float(os.environ.get("PROBE_MAX_INTERVAL_H", "24")) * 3600 # rock solid stations
+VOLATILITY_GAIN = 23 # interval = MAX / (1 + gain * volatility) -> 24h .. 1h before importance
+MASTER_WEIGHT = 2.0 # 'Master in Cell' bases: probed twice as often, first in the queue
+PROBE_BUDGET = int(os.environ.get("PROBE_BUDGET", "40")) # max probes per run (global rate budget)
+UNKNOWN_VOLATILITY = 0.5 # stations with no status history yet
+
+def load_masters():
+    """Codes named in any 'Master in Cell' (e.g. 'GSCTfixed; GSCTfixedS' -> GSCT)."""
+    return registry().masters()
+
+def volatility(data):
+    """0 (steady) .. 1 (flapping / failing) from the status state and the last probe."""
+    if (data.get('status') == 'Degraded' or data.get('data_verified') is False
+            or data.get('sats_tracked') == 0):
+        return 1.0
+    samples = data.get('state', {}).get('samples', "")
+    if len(samples) < 2:
+        return UNKNOWN_VOLATILITY
+    return min(1.0, data['state'].get('flaps', 0) / (len(samples) - 1))
+
+def probe_interval(data, importance):
+    """Seconds between probes for one station."""
+    interval = MAX_INTERVAL / (1 + VOLATILITY_GAIN * volatility(data)) / importance
+    return max(MIN_INTERVAL, min(MAX_INTERVAL, interval))
+
+def schedule(meta, now=None, budget=PROBE_BUDGET, masters=None):
+    """
+    Picks the stations to probe this run.
+    Candidates are Online/Degraded stations with a port; a station is due once
+    (now - last_probed) >= its interval. Returns [(code, port)], highest priority
+    first, at most 'budget' long.
+    """
+    now = time.time() if now is None else now
+    masters = load_masters() if masters is None else masters
+
+    queue = []
+    for code, data in meta.items():
+        if data.get('status') not in ('Online', 'Degraded') or not data.get('port'):
+            continue
+        importance = MASTER_WEIGHT if code in masters else 1.0
+        interval = probe_interval(data, importance)
+        overdue = (now - data.get('last_probed', 0)) / interval
+        if overdue >= 1:
+            heapq.heappush(queue, (-overdue * importance, code, data['port']))
+
+    due = len(queue)
+    targets = []
+    while queue and len(targets) < budget:
+        _, code, port = heapq.heappop(queue)
+        targets.append((code, port))
+
+    print(f"Scheduler: {due} stations due, probing {len(targets)} (budget {budget}), "
+          f"{due - len(targets)} deferred to the next run.")
+    return targets
+
+def mark_probed(data, now=None):
+    data['last_probed'] = int(time.time() if now is None else now)
@@ -2,6 +2,8 @@
 import geopandas as gpd
 import os
 
+from port_mask import load_mask
+
 # Paths (Relative to C:\Users\Thomas\Developer\SBC Stations)
 INPUT_GPKG = "Geopackage Files/statsnz-territorial-authority-2025-GPKG/territorial-authority-2025.gpkg"
 OUTPUT_MASK = "app/data/mask.geojson"
@@ -12,25 +14,10 @@ def process_mask():
         # fallback check?
         return
 
-    print("Loading GPKG...")
-    gdf = gpd.read_file(INPUT_GPKG)
-    
-    # Ensure CRS is 4326
-    if gdf.crs.to_epsg() != 4326:
-        print("Reprojecting to EPSG:4326...")
-        gdf = gdf.to_crs(epsg=4326)
-
-    print("Dissolving to single geometry...")
-    # Dissolve all features into one (New Zealand)
-    mask = gdf.dissolve()
-
-    print("Fixing topology (buffer(0))...")
-    # Buffer(0) helps fix self-intersections
-    mask['geometry'] = mask['geometry'].buffer(0)
+    # Read + reproject + dissolve + repair (port_mask.py, cached per source file hash)
+    print("Building mask...")
+    mask = gpd.GeoDataFrame(geometry=[load_mask(INPUT_GPKG)], crs="EPSG:4326")
 
-    # Convert to single MultiPolygon/Polygon (flatten)
-    # Just selecting the first row as dissolve creates one row
-    
     print(f"Saving to {OUTPUT_MASK}...")
     if os.path.exists(OUTPUT_MASK):
         os.remove(OUTPUT_MASK)
@@ -0,0 +1,382 @@
+"""
+Lightweight RTCM3 frame scanner.
+
+Works on raw bytes: syncs on the 0xD3 preamble, reads the 10-bit length,
+checks CRC-24Q and pulls out the 12-bit message type without decoding the
+message body. Full decoding (via pyrtcm) is only done for the message
+types a caller asks for.
+
+Frame layout:
+    0xD3 | 6 reserved bits + 10-bit length | payload (length bytes) | CRC-24Q (3 bytes)
+"""
+
+PREAMBLE = 0xD3
+HEADER_LEN = 3
+CRC_LEN = 3
+MAX_PAYLOAD = 1023
+
+# MSM Message Types (contain sat counts)
+MSM_TYPES = {
+    1074, 1075, 1076, 1077, # GPS
+    1084, 1085, 1086, 1087, # GLONASS
+    1094, 1095, 1096, 1097, # GALILEO
+    1124, 1125, 1126, 1127  # BEIDOU
+}
+# Antenna Reference Point (station position)
+ARP_TYPES = {1005, 1006}
+
+
+def _make_crc24q_table():
+    table = []
+    for i in range(256):
+        crc = i << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+        table.append(crc & 0xFFFFFF)
+    return table
+
+CRC24Q_TABLE = _make_crc24q_table()
+
+def crc24q(data, start=0, end=None):
+    """CRC-24Q (Qualcomm) over data[start:end]. A full frame incl. its CRC gives 0."""
+    if end is None:
+        end = len(data)
+    crc = 0
+    table = CRC24Q_TABLE
+    for i in range(start, end):
+        crc = ((crc << 8) & 0xFFFFFF) ^ table[(crc >> 16) ^ data[i]]
+    return crc
+
+
+class RTCMFramer:
+    """
+    Incremental RTCM3 framer. feed() raw stream bytes (any chunking), get back
+    (msg_type, frame) tuples for every complete, CRC-valid frame.
+
+    'frame' is the whole frame as bytes (preamble to CRC). Bytes that don't
+    belong to a valid frame (NTRIP response headers, line noise, corrupt
+    frames) are skipped and counted in 'skipped_bytes' / 'crc_errors'.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.skipped_bytes = 0
+        self.bytes_in = 0
+
+    def feed(self, data):
+        self._buf += data
+        self.bytes_in += len(data)
+        return list(self._extract())
+
+    def _extract(self):
+        buf = self._buf
+        pos = 0
+        n = len(buf)
+        try:
+            while True:
+                start = buf.find(PREAMBLE, pos)
+                if start < 0:
+                    self.skipped_bytes += n - pos
+                    pos = n
+                    return
+                self.skipped_bytes += start - pos
+                pos = start
+
+                if n - pos < HEADER_LEN:
+                    return # wait for more data
+
+                # Upper 6 bits of byte 1 are reserved (0); otherwise this isn't a frame start
+                if buf[pos + 1] & 0xFC:
+                    pos += 1
+                    self.skipped_bytes += 1
+                    continue
+
+                length = ((buf[pos + 1] & 0x03) << 8) | buf[pos + 2]
+                frame_len = HEADER_LEN + length + CRC_LEN
+                if n - pos < frame_len:
+                    return # wait for more data
+
+                if crc24q(buf, pos, pos + frame_len) != 0:
+                    # False sync or corrupt frame - resync on the next preamble
+                    self.crc_errors += 1
+                    self.skipped_bytes += 1
+                    pos += 1
+                    continue
+
+                msg_type = (buf[pos + 3] << 4) | (buf[pos + 4] >> 4) if length >= 2 else 0
+                frame = bytes(buf[pos:pos + frame_len])
+                pos += frame_len
+                self.frames += 1
+                yield msg_type, frame
+        finally:
+            del buf[:pos]
+
+
+def frame_payload(frame):
+    """Payload bytes of a frame returned by RTCMFramer (header and CRC stripped)."""
+    return frame[HEADER_LEN:-CRC_LEN]
+
+
+def decode_frame(frame):
+    """
+    Full decode of a single frame with pyrtcm (imported lazily so framing
+    works without it). Returns an RTCMMessage, or None if pyrtcm is missing
+    or can't parse it.
+    """
+    try:
+        from pyrtcm import RTCMReader
+    except ImportError:
+        return None
+    try:
+        return RTCMReader.parse(frame)
+    except Exception:
+        return None
+
+
+def iter_messages(framer, data, decode_types=()):
+    """
+    Feeds data to the framer and yields (msg_type, frame, parsed) tuples.
+    'parsed' is a full pyrtcm decode for types in decode_types, else None.
+    """
+    for msg_type, frame in framer.feed(data):
+        parsed = decode_frame(frame) if msg_type in decode_types else None
+        yield msg_type, frame, parsed
+
+
+# --- MSM Header Decoding ---
+
+# MSM message number range (first 3 digits) -> constellation
+MSM_CONSTELLATIONS = {
+    107: 'GPS',
+    108: 'GLONASS',
+    109: 'Galileo',
+    112: 'BeiDou',
+}
+# Legacy (non-MSM) observation messages - tracking, but no per-constellation masks
+LEGACY_OBS_TYPES = {1001, 1002, 1003, 1004, 1009, 1010, 1011, 1012}
+
+# Bit offsets within the payload (after the 12-bit message type)
+MSM_EPOCH_BIT = 24      # DF004/DF034/DF248/DF427 epoch time, 30 bits
+MSM_MULTIPLE_BIT = 54   # DF393 multiple message bit
+MSM_SAT_MASK_BIT = 73   # DF394, 64 bits
+MSM_SIG_MASK_BIT = 137  # DF395, 32 bits
+MSM_HEADER_BITS = 169   # up to (not incl.) the cell mask
+
+
+def get_bits(data, start, length):
+    """Unsigned big-endian bit field of 'length' bits starting at bit 'start'."""
+    first = start >> 3
+    last = (start + length + 7) >> 3
+    value = int.from_bytes(data[first:last], 'big')
+    return (value >> ((last << 3) - start - length)) & ((1 << length) - 1)
+
+
+def decode_msm_header(payload):
+    """
+    Header-only decode of an MSM4-7 payload (1074-1127).
+    Returns a dict, or None if the payload is too short.
+    Only reads the first 169 bits - observables are never touched.
+    """
+    if len(payload) * 8 < MSM_HEADER_BITS:
+        return None
+    msg_type = get_bits(payload, 0, 12)
+    sat_mask = get_bits(payload, MSM_SAT_MASK_BIT, 64)
+    sig_mask = get_bits(payload, MSM_SIG_MASK_BIT, 32)
+    return {
+        'msg_type': msg_type,
+        'constellation': MSM_CONSTELLATIONS.get(msg_type // 10),
+        'station_id': get_bits(payload, 12, 12),
+        'epoch': get_bits(payload, MSM_EPOCH_BIT, 30),
+        'multiple': get_bits(payload, MSM_MULTIPLE_BIT, 1),
+        'sat_mask': sat_mask,
+        'sig_mask': sig_mask,
+        'sats': bin(sat_mask).count('1'),
+        'signals': bin(sig_mask).count('1'),
+    }
+
+
+class MSMSummary:
+    """
+    Rolling per-constellation satellite/signal summary for one station.
+    add() every frame (cheap for non-MSM types); summary() at any time.
+
+    Messages sharing an epoch time are merged (a constellation may be split
+    across several messages), and each finished epoch updates the counts.
+    """
+
+    def __init__(self):
+        self.epochs = 0
+        self.legacy_obs = False
+        self._pending = {}   # constellation -> [epoch, sat_mask, sig_mask]
+        self._stats = {}     # constellation -> {'sats', 'sats_min', 'sats_max', 'sig_mask', 'epochs'}
+
+    def add(self, msg_type, frame):
+        if msg_type in LEGACY_OBS_TYPES:
+            self.legacy_obs = True
+            return None
+        if msg_type not in MSM_TYPES:
+            return None
+
+        header = decode_msm_header(frame_payload(frame))
+        if header is None:
+            return None
+
+        name = header['constellation']
+        pending = self._pending.get(name)
+        if pending and pending[0] != header['epoch']:
+            self._finish_epoch(name)
+            pending = None
+        if pending is None:
+            self._pending[name] = [header['epoch'], header['sat_mask'], header['sig_mask']]
+        else:
+            pending[1] |= header['sat_mask']
+            pending[2] |= header['sig_mask']
+        return header
+
+    def _finish_epoch(self, name):
+        _, sat_mask, sig_mask = self._pending.pop(name)
+        sats = bin(sat_mask).count('1')
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'sats': sats, 'sats_min': sats, 'sats_max': sats, 'sig_mask': 0, 'epochs': 0}
+        stats['sats'] = sats
+        stats['sats_min'] = min(stats['sats_min'], sats)
+        stats['sats_max'] = max(stats['sats_max'], sats)
+        stats['sig_mask'] |= sig_mask
+        stats['epochs'] += 1
+        self.epochs = max(self.epochs, stats['epochs'])
+
+    def flush(self):
+        """Closes any epoch still being collected (call at the end of the probe window)."""
+        for name in list(self._pending):
+            self._finish_epoch(name)
+
+    def summary(self):
+        """{constellation: {'sats', 'sats_min', 'sats_max', 'signals', 'epochs'}} for finished epochs."""
+        return {
+            name: {
+                'sats': s['sats'],
+                'sats_min': s['sats_min'],
+                'sats_max': s['sats_max'],
+                'signals': bin(s['sig_mask']).count('1'),
+                'epochs': s['epochs'],
+            }
+            for name, s in sorted(self._stats.items())
+        }
+
+    def sats_tracked(self):
+        """
+        Total satellites in the latest epoch across constellations.
+        0 only if MSM epochs were decoded with empty satellite masks; None if
+        no MSM epoch was seen (e.g. only 1005/1006/1033 or legacy observations
+        in the probe window), since that says nothing about tracking.
+        """
+        if self._stats:
+            return sum(s['sats'] for s in self._stats.values())
+        return None
+
+
+# --- MSM Epoch Time / Latency ---
+
+GPS_EPOCH_UNIX = 315964800 # 1980-01-06 00:00:00 UTC
+GPS_UTC_LEAP_SECONDS = 18  # GPS - UTC (unchanged since 2017-01-01)
+BDS_GPS_OFFSET = 14        # BDT = GPST - 14 s
+GLONASS_UTC_OFFSET = 3 * 3600 # GLONASS time = UTC(SU) + 3 h
+WEEK_MS = 604800 * 1000
+DAY_MS = 86400 * 1000
+
+
+def _wrap(diff_ms, period_ms):
+    """Signed difference folded into (-period/2, period/2] (handles week/day rollover)."""
+    diff_ms %= period_ms
+    if diff_ms > period_ms // 2:
+        diff_ms -= period_ms
+    return diff_ms
+
+
+def msm_latency_ms(header, rx_time):
+    """
+    Latency (ms) between an MSM epoch and the time it was received.
+    rx_time is a Unix timestamp (time.time()). Uses the constellation's own
+    time scale: GPS/Galileo TOW, BeiDou TOW (GPS - 14 s), GLONASS time of day
+    (UTC + 3 h, day-of-week bits ignored). Returns None for unknown types.
+    """
+    name = header['constellation']
+    epoch = header['epoch']
+
+    if name == 'GLONASS':
+        tod_ms = epoch & 0x7FFFFFF # lower 27 bits; top 3 bits are day of week
+        rx_tod_ms = int((rx_time + GLONASS_UTC_OFFSET) * 1000) % DAY_MS
+        return _wrap(rx_tod_ms - tod_ms, DAY_MS)
+
+    if name in ('GPS', 'Galileo', 'BeiDou'):
+        tow_ms = epoch
+        if name == 'BeiDou':
+            tow_ms += BDS_GPS_OFFSET * 1000
+        rx_gps_ms = int((rx_time - GPS_EPOCH_UNIX + GPS_UTC_LEAP_SECONDS) * 1000)
+        return _wrap(rx_gps_ms % WEEK_MS - tow_ms, WEEK_MS)
+
+    return None
+
+
+def percentiles(values):
+    """{'p50', 'p95', 'max', 'samples'} (nearest-rank) for a list of numbers, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    n = len(ordered)
+    return {
+        'p50': ordered[max(0, -(-50 * n // 100) - 1)],
+        'p95': ordered[max(0, -(-95 * n // 100) - 1)],
+        'max': ordered[-1],
+        'samples': n,
+    }
+
+
+# --- 1005/1006 Antenna Reference Point ---
+
+ECEF_SCALE = 0.0001 # DF025-DF028 resolution, metres
+
+
+def get_signed_bits(data, start, length):
+    """Two's complement signed bit field."""
+    value = get_bits(data, start, length)
+    if value & (1 << (length - 1)):
+        value -= 1 << length
+    return value
+
+
+def decode_arp(payload):
+    """
+    Decodes a 1005/1006 payload. Returns {'station_id', 'x', 'y', 'z',
+    'antenna_height'} in metres (ECEF; antenna_height only for 1006, else None),
+    or None if the payload is too short or not an ARP message.
+    """
+    if len(payload) < 19:
+        return None
+    msg_type = get_bits(payload, 0, 12)
+    if msg_type not in ARP_TYPES:
+        return None
+    arp = {
+        'station_id': get_bits(payload, 12, 12),
+        'x': get_signed_bits(payload, 34, 38) * ECEF_SCALE,
+        'y': get_signed_bits(payload, 74, 38) * ECEF_SCALE,
+        'z': get_signed_bits(payload, 114, 38) * ECEF_SCALE,
+        'antenna_height': None,
+    }
+    if msg_type == 1006 and len(payload) >= 21:
+        arp['antenna_height'] = get_bits(payload, 152, 16) * ECEF_SCALE
+    return arp
+
+
+def build_frame(payload):
+    """Wraps a payload in an RTCM3 frame (preamble, length, CRC-24Q). Used by the caster simulator."""
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"RTCM payload too long ({len(payload)} bytes)")
+    header = bytes([PREAMBLE, len(payload) >> 8, len(payload) & 0xFF])
+    frame = header + bytes(payload)
+    return frame + crc24q(frame).to_bytes(3, 'big')
@@ -111,20 +111,14 @@ if __name__ == '__main__':
     if token_input:
         # Import here to avoid polluting global namespace earlier
         import json
-        import requests
+        from smartfix_api import SmartFixClient
         
         def update_station_status(token):
             print("Fetching station status from SBC API...")
-            BASE_URL = "https://smartfix.co.nz/SBC/API"
-            HEADERS = {
-                "X-SBC-Auth": token,
-                "Accept": "application/json"
-            }
+            client = SmartFixClient("https://smartfix.co.nz/SBC/API", username=None, password=None, token=token)
             try:
-                response = requests.get(f"{BASE_URL}/sites", headers=HEADERS, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    sites = data['sites'] if isinstance(data, dict) and 'sites' in data else data
+                sites = client.get_sites()
+                if sites is not None:
                     status_map = {}
                     online_count = 0
                     for site in sites:
@@ -148,7 +142,7 @@ if __name__ == '__main__':
                     print(f"Successfully updated status for {len(sites)} stations ({online_count} Online).")
                     print(f"Saved to {output_path}")
                 else:
-                    print(f"API Error: {response.status_code} - {response.text}")
+                    print("API Error: Could not retrieve sites.")
             except Exception as e:
                 print(f"Failed to update status: {e}")
 
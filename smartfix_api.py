@@ -0,0 +1,254 @@
+"""
+Shared SmartFix / SBC REST API client.
+
+- One requests.Session per client: HTTP keep-alive connection pooling.
+- Bounded retries with exponential backoff on connection errors and 5xx.
+- Session token cached on disk (with expiry) and reused across runs;
+  a fresh login only happens when there is no valid cached token or the
+  API answers 401.
+
+Used by check_api_status.py, list_station_status.py, check_api.py,
+app/serve.py and serve_https.py.
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from atomic_io import write_json_atomic
+
+BASE_URL = os.environ.get("SMARTFIX_API_URL") or "https://smartfix.co.nz/SBC/API/v12.0"
+# Use Environment Variables with fallback to provided defaults
+USERNAME = os.environ.get("SMARTFIX_USER") or "Admin"
+PASSWORD = os.environ.get("SMARTFIX_PASSWORD") or "Surv3y"
+
+TOKEN_CACHE_FILE = os.environ.get("SMARTFIX_TOKEN_CACHE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".sbc_token_cache.json")
+# Assumed token lifetime when the login response doesn't say (seconds)
+DEFAULT_TOKEN_TTL = 45 * 60
+# Treat a cached token as expired this long before it really does
+TOKEN_EXPIRY_MARGIN = 60
+
+TIMEOUT = 10 # seconds per request
+RETRIES = 3
+BACKOFF_FACTOR = 0.5 # 0.5s, 1s, 2s...
+POOL_SIZE = 16
+
+# SmartFix uses a certificate the runners can't verify (same as the old urllib ssl context)
+VERIFY_SSL = False
+if not VERIFY_SSL:
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Keys that may hold the session token in a login response
+TOKEN_KEYS = ['token', 'sessionToken', 'id', 'accessToken']
+TOKEN_HEADERS = ['x-sbc-auth', 'token', 'authorization']
+
+
+class SmartFixClient:
+    def __init__(self, base_url=BASE_URL, username=USERNAME, password=PASSWORD,
+                 token=None, cache_file=TOKEN_CACHE_FILE):
+        """
+        token: explicit session token (e.g. pasted by the user). Used as-is;
+        if it's rejected and credentials are set, the client logs in instead.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.cache_file = cache_file
+        self.token = token
+        self.login_count = 0
+        self._login_lock = threading.Lock() # one re-login when many threads hit 401 together
+
+        self.session = requests.Session()
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.verify = VERIFY_SSL
+        self.session.headers.update({"Accept": "application/json"})
+
+    # --- Token Cache ---
+
+    def _cache_key(self):
+        return f"{self.base_url}|{self.username}"
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load_cached_token(self):
+        entry = self._read_cache().get(self._cache_key())
+        if entry and entry.get('expires', 0) - TOKEN_EXPIRY_MARGIN > time.time():
+            return entry['token']
+        return None
+
+    def _save_cached_token(self, token, ttl):
+        if not self.cache_file:
+            return
+        cache = self._read_cache()
+        now = time.time()
+        # Drop expired entries while we're here
+        cache = {k: v for k, v in cache.items() if v.get('expires', 0) > now}
+        cache[self._cache_key()] = {'token': token, 'expires': now + ttl}
+        self._write_cache(cache)
+
+    def _forget_cached_token(self):
+        if not self.cache_file:
+            return
+        cache = self._read_cache()
+        if cache.pop(self._cache_key(), None) is not None:
+            self._write_cache(cache)
+
+    def _write_cache(self, cache):
+        """Temp file (owner-only) + rename, so the cache is never half-written or world-readable."""
+        try:
+            write_json_atomic(self.cache_file, cache, mode=0o600)
+        except OSError as e:
+            print(f"Warning: Could not write token cache: {e}")
+
+    # --- Login ---
+
+    @staticmethod
+    def _extract_token(response):
+        body = None
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+
+        token = None
+        if isinstance(body, dict):
+            lowered = {k.lower(): v for k, v in body.items()}
+            for k in TOKEN_KEYS:
+                if k.lower() in lowered:
+                    token = lowered[k.lower()]
+                    break
+        elif isinstance(body, str) and body.strip():
+            token = body
+
+        if not token:
+            for k, v in response.headers.items():
+                if k.lower() in TOKEN_HEADERS:
+                    token = v
+                    break
+
+        ttl = DEFAULT_TOKEN_TTL
+        if isinstance(body, dict):
+            for k in ('expiresIn', 'expires_in'):
+                if isinstance(body.get(k), (int, float)):
+                    ttl = body[k]
+        return (str(token).strip().strip('"') if token else None), ttl
+
+    def login(self):
+        """Fresh login. Returns the token (also cached on disk), or None."""
+        url = f"{self.base_url}/login"
+        self.login_count += 1
+
+        # Try lowercase payload first, then the capitalised (legacy) one
+        response = None
+        for payload in ({"username": self.username, "password": self.password},
+                        {"Username": self.username, "Password": self.password}):
+            try:
+                response = self.session.post(url, json=payload, timeout=TIMEOUT)
+            except requests.RequestException as e:
+                print(f"Login request failed: {e}")
+                return None
+            if response.status_code == 200:
+                break
+            print(f"Login failed with {'lowercase' if 'username' in payload else 'legacy'} payload "
+                  f"(Status {response.status_code}).")
+
+        if response is None or response.status_code != 200:
+            return None
+
+        token, ttl = self._extract_token(response)
+        if not token:
+            print(f"Login failed. No token in response: {response.text[:200]}")
+            return None
+
+        self.token = token
+        self._save_cached_token(token, ttl)
+        return token
+
+    def ensure_token(self):
+        """Explicit token > cached token > fresh login."""
+        if not self.token:
+            self.token = self._load_cached_token()
+        if not self.token and self.username:
+            self.login()
+        return self.token
+
+    # --- Requests ---
+
+    def request(self, method, path, **kwargs):
+        """
+        Authenticated request (path relative to base_url, or a full URL).
+        Re-logs in once on 401. Returns the requests.Response.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+        kwargs.setdefault('timeout', TIMEOUT)
+        headers = dict(kwargs.pop('headers', None) or {})
+
+        with self._login_lock:
+            used_token = self.ensure_token()
+        if used_token:
+            headers['X-SBC-Auth'] = used_token
+        response = self.session.request(method, url, headers=headers, **kwargs)
+
+        if response.status_code == 401 and self.username and self.password:
+            # Token expired/revoked: drop it and log in again (once, unless another thread already did)
+            with self._login_lock:
+                if self.token == used_token:
+                    self._forget_cached_token()
+                    self.token = None
+                    self.login()
+            if self.token:
+                headers['X-SBC-Auth'] = self.token
+                response = self.session.request(method, url, headers=headers, **kwargs)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def get_sites(self):
+        """
+        All sites from /sites (follows pagination when the API pages).
+        Returns a list of site dicts, or None on failure.
+        """
+        sites = []
+        page = None
+        while True:
+            params = {'page': page} if page else None
+            response = self.get("sites", params=params)
+            if response.status_code != 200:
+                print(f"Failed to retrieve sites (Status {response.status_code}).")
+                return None
+            try:
+                data = response.json()
+            except ValueError:
+                print("Failed to retrieve sites (response is not JSON).")
+                return None
+
+            if isinstance(data, list):
+                return sites + data
+            sites.extend(data.get('sites', []))
+            page = data.get('nextPage')
+            if not page:
+                return sites
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,239 @@
+import asyncio
+import random
+import socket
+import time
+import os
+from collections import deque
+from datetime import datetime
+
+from check_station_health import NETWORKS, HOST, get_station_meta, save_station_meta, build_stream_request
+from networks import station_networks
+from rtcm_frames import RTCMFramer
+
+# Long-running RTCM monitor.
+# Holds one connection per mountpoint on a single asyncio loop (instead of the
+# hourly connect/read 5s/close probe), keeps rolling per-station counters and
+# writes a snapshot into station_meta.json on a fixed cadence.
+#
+# Run: python station_monitor.py   (Ctrl+C to stop)
+
+# Configuration
+SNAPSHOT_INTERVAL = float(os.environ.get("MONITOR_SNAPSHOT_INTERVAL", "30")) # seconds between meta writes
+WINDOW = float(os.environ.get("MONITOR_WINDOW", "60")) # rolling window for rates, seconds
+CONNECT_TIMEOUT = 10 # seconds
+STALL_TIMEOUT = 30 # no bytes for this long -> drop and reconnect
+BACKOFF_MIN = 2 # seconds
+BACKOFF_MAX = 300 # seconds
+STARTUP_SPREAD = 10 # spread initial connects over this many seconds (no connection storm)
+
+class StreamStats:
+    """Rolling counters for one mountpoint ('network': the caster it's read from, primary if None)."""
+
+    def __init__(self, code, port, network=None):
+        self.code = code
+        self.port = port
+        self.network = network
+        self.connected = False
+        self.reconnects = 0
+        self.last_error = None
+        self.last_message = None # time.time() of last valid RTCM frame
+        self.types_seen = set()
+        self.total_msgs = 0
+        self.total_bytes = 0
+        self.started = time.time()
+        # (timestamp, bytes, msgs) per read, trimmed to WINDOW
+        self._samples = deque()
+
+    def on_data(self, nbytes, frames, now):
+        self.total_bytes += nbytes
+        self.total_msgs += len(frames)
+        for msg_type, _ in frames:
+            self.types_seen.add(msg_type)
+        if frames:
+            self.last_message = now
+        self._samples.append((now, nbytes, len(frames)))
+        self._trim(now)
+
+    def _trim(self, now):
+        while self._samples and self._samples[0][0] < now - WINDOW:
+            self._samples.popleft()
+
+    def snapshot(self, now):
+        self._trim(now)
+        window_bytes = sum(s[1] for s in self._samples)
+        window_msgs = sum(s[2] for s in self._samples)
+        span = max(1.0, min(WINDOW, now - self.started)) # shorter span until the first window fills
+        return {
+            "connected": self.connected,
+            "msg_rate": round(window_msgs / span, 2), # msgs/s over the window
+            "bytes_per_sec": round(window_bytes / span, 1),
+            "since_last_msg": None if self.last_message is None else round(now - self.last_message, 1),
+            "msg_types": sorted(self.types_seen),
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+MAX_HEADER_BYTES = 16384
+
+async def read_response_head(reader):
+    """Reads until the end of the response headers (ICY: the status line). Returns the raw bytes."""
+    head = b""
+    while len(head) < MAX_HEADER_BYTES:
+        if head.startswith(b"ICY") and b"\r\n" in head:
+            break
+        if b"\r\n\r\n" in head:
+            break
+        chunk = await asyncio.wait_for(reader.read(4096), timeout=STALL_TIMEOUT)
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+def parse_stream_response(head):
+    """
+    (accepted, reason, body) for a caster response to a mountpoint request.
+    Accepted: NTRIP 1 'ICY 200 OK', or an HTTP 200 that isn't the caster's
+    sourcetable (NTRIP 2 casters answer an unknown mountpoint with
+    '200 OK' + 'Content-Type: gnss/sourcetable'). 'body' is whatever stream
+    data came in with the headers.
+    """
+    if head.startswith(b"ICY 200"):
+        body = head.split(b"\r\n", 1)[1] if b"\r\n" in head else b""
+        return True, None, body[2:] if body.startswith(b"\r\n") else body
+
+    header, _, body = head.partition(b"\r\n\r\n")
+    lines = header.split(b"\r\n")
+    status = lines[0].split()
+    if len(status) < 2 or not status[0].startswith(b"HTTP/") or status[1] != b"200":
+        return False, lines[0].decode('latin-1') or "Empty response", b""
+
+    headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(b":")
+        headers[key.strip().lower()] = value.strip().lower()
+    if b"sourcetable" in headers.get(b"content-type", b""):
+        return False, "Mountpoint not found (caster sent its sourcetable)", b""
+    return True, None, body
+
+async def watch_station(addr, stats):
+    """Keeps one connection open to a mountpoint; reconnects with jittered exponential backoff."""
+    await asyncio.sleep(random.uniform(0, STARTUP_SPREAD))
+    backoff = BACKOFF_MIN
+
+    while True:
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(addr, int(stats.port)), timeout=CONNECT_TIMEOUT)
+            network = stats.network
+            writer.write(build_stream_request(stats.code, network.host, network.user, network.password)
+                         if network else build_stream_request(stats.code))
+            await writer.drain()
+
+            accepted, reason, body = parse_stream_response(await read_response_head(reader))
+            if not accepted:
+                raise ConnectionError(reason)
+
+            # Only 'connected' once real RTCM frames (0xD3 preamble + CRC) arrive
+            framer = RTCMFramer()
+            chunk = body or await asyncio.wait_for(reader.read(4096), timeout=STALL_TIMEOUT)
+            while chunk:
+                frames = framer.feed(chunk)
+                stats.on_data(len(chunk), frames, time.time())
+                if frames:
+                    stats.connected = True
+                    stats.last_error = None
+                    backoff = BACKOFF_MIN # healthy stream, reset backoff
+                chunk = await asyncio.wait_for(reader.read(4096), timeout=STALL_TIMEOUT)
+            stats.last_error = "Closed by caster"
+
+        except asyncio.TimeoutError:
+            stats.last_error = "Timed out (connect/stall)"
+        except (OSError, ConnectionError) as e:
+            stats.last_error = str(e)
+        except Exception as e:
+            # Anything else (malformed header/frame...) only restarts this station, never the monitor
+            stats.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            stats.connected = False
+            if writer is not None:
+                writer.close()
+
+        # Full jitter: spread reconnects so a caster restart doesn't cause a storm
+        delay = random.uniform(BACKOFF_MIN, backoff)
+        backoff = min(backoff * 2, BACKOFF_MAX)
+        stats.reconnects += 1
+        await asyncio.sleep(delay)
+
+def write_snapshot(all_stats):
+    """Merges live counters into the current station_meta.json (other scripts may have updated it)."""
+    now = time.time()
+    meta = get_station_meta()
+    checked = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for code, stats in all_stats.items():
+        if code in meta:
+            meta[code]['stream'] = stats.snapshot(now)
+            meta[code]['stream']['checked'] = checked
+    save_station_meta(meta)
+
+    live = sum(1 for s in all_stats.values() if s.connected)
+    print(f"[{checked}] Snapshot: {live}/{len(all_stats)} streams connected.")
+
+async def snapshot_loop(all_stats):
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            write_snapshot(all_stats)
+        except Exception as e:
+            print(f"Warning: Could not write snapshot: {e}")
+
+async def run():
+    meta = get_station_meta()
+    networks = station_networks(meta, NETWORKS)
+    all_stats = {
+        code: StreamStats(code, data['port'], networks.get(code))
+        for code, data in meta.items() if data.get('port')
+    }
+    if not all_stats:
+        print("No stations with a port in station_meta.json. Nothing to monitor.")
+        return
+
+    # Resolve each caster once, shared by all of its connections
+    loop = asyncio.get_running_loop()
+    addrs = {}
+    for host in sorted({s.network.host if s.network else HOST for s in all_stats.values()}):
+        try:
+            infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+            addrs[host] = infos[0][4][0]
+            print(f"Resolved {host} -> {addrs[host]}")
+        except OSError as e:
+            print(f"Warning: Could not resolve {host} ({e}). Its stations aren't monitored.")
+
+    watched = []
+    for stats in all_stats.values():
+        host = stats.network.host if stats.network else HOST
+        if host in addrs:
+            watched.append((addrs[host], stats))
+        else:
+            stats.last_error = f"Could not resolve {host}"
+    if not watched:
+        print("No caster could be resolved. Nothing to monitor.")
+        return
+    print(f"Monitoring {len(watched)} mountpoints on {len(addrs)} caster(s), "
+          f"snapshot every {SNAPSHOT_INTERVAL}s...")
+
+    tasks = [asyncio.create_task(watch_station(addr, stats)) for addr, stats in watched]
+    tasks.append(asyncio.create_task(snapshot_loop(all_stats)))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        write_snapshot(all_stats)
+
+def main():
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\nMonitor stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+from collections import deque
+
+# Per-station status state machine with hysteresis and flap detection.
+#
+# Each status run feeds one raw sample (online True/False) per station.
+# - A station only changes Online <-> Offline after N consecutive samples
+#   that agree (STATUS_UP_SAMPLES / STATUS_DOWN_SAMPLES).
+# - The last HISTORY_SIZE samples are kept in a fixed-size ring buffer;
+#   'flaps' is the number of raw Online/Offline flips inside it.
+# - A station that flips FLAP_THRESHOLD+ times in the buffer is "Degraded"
+#   until it has been steady for STABLE_SAMPLES runs.
+#
+# State is stored per station in station_meta.json under "state":
+#   {"samples": "1101...", "streak": 3, "stable": "Online", "flaps": 2}
+
+# Configuration
+UP_SAMPLES = int(os.environ.get("STATUS_UP_SAMPLES", "2")) # consecutive online samples to go Online
+DOWN_SAMPLES = int(os.environ.get("STATUS_DOWN_SAMPLES", "2")) # consecutive offline samples to go Offline
+HISTORY_SIZE = int(os.environ.get("STATUS_HISTORY_SIZE", "24")) # ring buffer length (runs)
+FLAP_THRESHOLD = int(os.environ.get("STATUS_FLAP_THRESHOLD", "4")) # flips in the buffer -> Degraded
+STABLE_SAMPLES = int(os.environ.get("STATUS_STABLE_SAMPLES", "6")) # steady runs to leave Degraded early
+
+class StationState:
+    def __init__(self, stable="Offline", samples="", streak=0):
+        self.stable = stable # last confirmed Online/Offline
+        self.samples = deque((c == "1" for c in samples), maxlen=HISTORY_SIZE)
+        self.streak = streak # consecutive samples equal to the latest one
+
+    @classmethod
+    def from_meta(cls, data):
+        """Restores state from a station_meta entry (seeded from its status on first use)."""
+        state = data.get('state')
+        if state:
+            return cls(state.get('stable', "Offline"), state.get('samples', ""), state.get('streak', 0))
+        # No history yet: trust the current status so the first run doesn't flip everything
+        stable = "Online" if data.get('status') in ("Online", "Degraded") else "Offline"
+        return cls(stable)
+
+    @property
+    def flaps(self):
+        """Raw Online/Offline flips inside the ring buffer."""
+        s = list(self.samples)
+        return sum(1 for a, b in zip(s, s[1:]) if a != b)
+
+    @property
+    def status(self):
+        if self.flaps >= FLAP_THRESHOLD and self.streak < STABLE_SAMPLES:
+            return "Degraded"
+        return self.stable
+
+    def update(self, online):
+        """Feeds one raw sample. Returns the (hysteresis-filtered) status."""
+        if self.samples and self.samples[-1] == online:
+            self.streak += 1
+        else:
+            self.streak = 1
+        self.samples.append(online)
+
+        if online and self.streak >= UP_SAMPLES:
+            self.stable = "Online"
+        elif not online and self.streak >= DOWN_SAMPLES:
+            self.stable = "Offline"
+        return self.status
+
+    def to_meta(self):
+        return {
+            "samples": "".join("1" if s else "0" for s in self.samples),
+            "streak": self.streak,
+            "stable": self.stable,
+            "flaps": self.flaps,
+        }
+
+def apply_sample(data, online, current_time):
+    """
+    Updates one station_meta entry from a raw sample: state, status and last_seen.
+    Returns the new status.
+    """
+    state = StationState.from_meta(data)
+    status = state.update(online)
+    data['state'] = state.to_meta()
+    data['status'] = status
+    if online:
+        data['last_seen'] = current_time
+    return status
+
+def last_sample(data):
+    """Latest raw sample for a meta entry (falls back to its status)."""
+    samples = data.get('state', {}).get('samples')
+    if samples:
+        return samples[-1] == "1"
+    return data.get('status') == 'Online'
+
+def flapping_report(station_meta):
+    """QA report lines for stations with flips in their ring buffer (most flips first)."""
+    rows = [(code, data['state']['flaps'], data['status']) for code, data in station_meta.items()
+            if data.get('state', {}).get('flaps')]
+    if not rows:
+        return []
+    report_lines = [f"\nFLAPPING STATIONS ({len(rows)}; flips in last {HISTORY_SIZE} runs, Degraded at {FLAP_THRESHOLD}+):"]
+    rows.sort(key=lambda r: (-r[1], r[0]))
+    for i in range(0, len(rows), 5):
+        report_lines.append(", ".join(f"{code} {flaps}x ({status})" for code, flaps, status in rows[i:i+5]))
+    return report_lines
@@ -0,0 +1,171 @@
+import json
+
+from networks import load_networks
+
+# Shared station registry.
+#
+# The station GeoJSONs, station_meta.json and station_port_mapping.json are
+# read once, lazily, on first use, and every station is a compact Station
+# record keyed by its canonical code (O(1) lookup). Code clean-up happens here
+# and nowhere else:
+#   - upper case, surrounding whitespace stripped
+#   - ALIASES: renamed sites (GSMG -> GSM2, same as app/script.js)
+#   - exclusions: the station's network's excluded_stations (networks.json, see
+#     Network.is_excluded) + EXTRA_EXCLUDED, checked on the raw code before
+#     ALIASES (an excluded GSMG stream is dropped, not merged into GSM2).
+#     The GeoJSON sites are checked against the primary network.
+#
+# Usage:
+#   from stations import registry
+#   station = registry().get("AUCK")   # Station or None
+#   registry().meta                     # station_meta.json dict (shared, mutable)
+
+# Configuration
+GLOBAL_GEOJSON = "app/data/Sites_20250725_Global.geojson" # SmartFix sites
+LINZ_GEOJSON = "app/data/Sites_20250725_LINZ.geojson"
+SITES_GEOJSONS = [GLOBAL_GEOJSON, LINZ_GEOJSON]
+META_FILE = "app/data/station_meta.json"
+MAPPING_FILE = "app/data/station_port_mapping.json"
+
+ALIASES = {"GSMG": "GSM2"} # old site code -> current code
+EXTRA_EXCLUDED = {"NTGT", "JTGT"} # LINZ sites that aren't part of any network
+
+def canonical_code(code):
+    """'gsmg ' -> 'GSM2'. Returns None for empty codes."""
+    if not code:
+        return None
+    code = str(code).strip().upper()
+    return ALIASES.get(code, code)
+
+def read_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def read_meta(path=META_FILE):
+    """A fresh read of station_meta.json ({} if missing/corrupt). For long-running readers."""
+    return read_json(path, {})
+
+class Station:
+    """One published site (GeoJSON feature). 'source' is the GeoJSON path, 'properties' the raw attributes."""
+    __slots__ = ('code', 'name', 'lat', 'lon', 'height', 'cluster', 'masters', 'source', 'properties')
+
+    def __init__(self, code, props, lon, lat, source):
+        self.code = code
+        self.name = props.get('Site Name')
+        self.lat = lat
+        self.lon = lon
+        self.height = props.get('Height')
+        self.cluster = props.get('Cluster Name')
+        # 'GSCTfixed; GSCTfixedS' -> ('GSCT',)
+        self.masters = tuple(sorted({canonical_code(n.strip()[:4]) for n in (props.get('Master in Cell') or "").split(";")
+                                     if len(n.strip()) >= 4}))
+        self.source = source
+        self.properties = props
+
+    def __repr__(self):
+        return f"Station({self.code!r}, lat={self.lat}, lon={self.lon})"
+
+class StationRegistry:
+    def __init__(self, geojson_paths=SITES_GEOJSONS, meta_file=META_FILE, mapping_file=MAPPING_FILE, networks=None,
+                 extra_excluded=EXTRA_EXCLUDED):
+        self.geojson_paths = geojson_paths
+        self.meta_file = meta_file
+        self.mapping_file = mapping_file
+        if networks is None:
+            networks = load_networks()
+        self.primary = networks[0] if networks else None
+        self.extra_excluded = {c.upper() for c in extra_excluded}
+        self._sites = None
+        self._meta = None
+        self._mapping = None
+
+    def is_excluded(self, code, network=None):
+        """
+        Raw (pre-alias) code excluded on 'network' (the primary network if None) or in EXTRA_EXCLUDED.
+        """
+        if not code:
+            return False
+        code = str(code).strip().upper()
+        network = network or self.primary
+        return code in self.extra_excluded or bool(network and network.is_excluded(code))
+
+    @property
+    def excluded(self):
+        """Codes dropped from the GeoJSON sites (primary network's list + EXTRA_EXCLUDED)."""
+        return self.extra_excluded | (self.primary.excluded if self.primary else set())
+
+    @property
+    def sites(self):
+        """{code: Station} from the GeoJSONs (first file wins on duplicates)."""
+        if self._sites is None:
+            self._sites = {}
+            for path in self.geojson_paths:
+                data = read_json(path, None)
+                if data is None:
+                    print(f"Warning: Could not load {path}")
+                    continue
+                for feature in data.get('features', []):
+                    props = feature.get('properties') or {}
+                    raw_code = props.get('Site Code')
+                    code = canonical_code(raw_code)
+                    if not code or code in self._sites or self.is_excluded(raw_code):
+                        continue
+                    lon, lat = ((feature.get('geometry') or {}).get('coordinates')
+                                or [props.get('longitude_dd'), props.get('latitude_dd')])[:2]
+                    self._sites[code] = Station(code, props, lon, lat, path)
+        return self._sites
+
+    @property
+    def meta(self):
+        """station_meta.json as loaded once (callers update it in place and save it)."""
+        if self._meta is None:
+            self._meta = read_meta(self.meta_file)
+        return self._meta
+
+    @property
+    def mapping(self):
+        """{code: port} from station_port_mapping.json."""
+        if self._mapping is None:
+            self._mapping = {canonical_code(k): int(v) for k, v in read_json(self.mapping_file, {}).items()}
+        return self._mapping
+
+    def get(self, code):
+        return self.sites.get(canonical_code(code))
+
+    def __contains__(self, code):
+        return canonical_code(code) in self.sites
+
+    def __iter__(self):
+        return iter(self.sites.values())
+
+    def __len__(self):
+        return len(self.sites)
+
+    def codes(self, source=None):
+        """Site codes, optionally only those from one GeoJSON (e.g. GLOBAL_GEOJSON)."""
+        return {station.code for station in self if source is None or station.source == source}
+
+    def port(self, code):
+        """Caster port: station_meta.json first, then the port mapping."""
+        code = canonical_code(code)
+        return (self.meta.get(code) or {}).get('port') or self.mapping.get(code)
+
+    def masters(self):
+        """Codes named in any 'Master in Cell'."""
+        return {m for station in self for m in station.masters}
+
+    def clusters(self):
+        """{code: 'Cluster Name'}."""
+        return {station.code: station.cluster for station in self if station.cluster}
+
+_registry = None
+
+def registry():
+    """The process-wide registry (files are read on first access)."""
+    global _registry
+    if _registry is None:
+        _registry = StationRegistry()
+    return _registry
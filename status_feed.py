@@ -0,0 +1,89 @@
+import json
+from datetime import datetime
+
+from atomic_io import write_json_atomic
+
+# Versioned status snapshot + delta feed for the web map.
+#
+# station_meta.json carries everything (health, state, API details...). The map
+# only needs a few fields per station, so each status run also publishes:
+#   status_snapshot.json  {"version": N, "generated": ..., "stations": {CODE: {fields}}}
+#   status_delta.json     {"version": N, "deltas": [{"base_version": N-1, "version": N,
+#                           "changed": {CODE: {fields}}, "removed": [CODE, ...]}, ...]}
+# The version only goes up when a station's DELTA_FIELDS changed (not on every
+# last_seen tick, or every online station would be in every delta; the other
+# fields ride along with the next real change). Clients keep their
+# cached snapshot, poll the small delta file and apply every delta newer than
+# their version; if they're older than the oldest kept delta they refetch the snapshot.
+
+# Configuration
+SNAPSHOT_FILE = "app/data/status_snapshot.json"
+DELTA_FILE = "app/data/status_delta.json"
+MAX_DELTAS = 48 # versions kept in the delta file
+# Fields whose change puts a station into a delta (status, ports, state)
+DELTA_FIELDS = ["status", "port", "network_port", "flaps"]
+
+def snapshot_entry(data):
+    """The per-station fields the map uses."""
+    return {
+        "status": data.get('status'),
+        "port": data.get('port'),
+        "network_port": data.get('network_port'),
+        "last_seen": data.get('last_seen'),
+        "sats_tracked": data.get('sats_tracked'),
+        "flaps": data.get('state', {}).get('flaps', 0),
+    }
+
+def load_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def delta_key(entry):
+    return None if entry is None else tuple(entry.get(field) for field in DELTA_FIELDS)
+
+def diff_snapshots(old, new):
+    """(changed {code: entry}, removed [codes]) between two station dicts, compared on DELTA_FIELDS."""
+    changed = {code: entry for code, entry in new.items() if delta_key(old.get(code)) != delta_key(entry)}
+    removed = sorted(code for code in old if code not in new)
+    return changed, removed
+
+def publish_status_feed(meta):
+    """Writes a new snapshot version + delta if anything changed. Returns the current version."""
+    try:
+        previous = load_json(SNAPSHOT_FILE, {})
+        feed = load_json(DELTA_FILE, {})
+        old_stations = previous.get('stations', {})
+        version = max(previous.get('version', 0), feed.get('version', 0))
+
+        stations = {code: snapshot_entry(data) for code, data in meta.items()}
+        changed, removed = diff_snapshots(old_stations, stations)
+        if not changed and not removed and previous:
+            print(f"Status feed unchanged (version {version}).")
+            return version
+
+        version += 1
+        generated = datetime.now().strftime("%Y-%m-%d %H:%M")
+        deltas = feed.get('deltas', []) if previous else []
+        # No delta for the very first snapshot (clients without a cache fetch the snapshot anyway)
+        if previous:
+            deltas.append({
+                "base_version": version - 1,
+                "version": version,
+                "generated": generated,
+                "changed": changed,
+                "removed": removed,
+            })
+
+        # Snapshot first: a client that sees the new delta can always fall back to it
+        write_json_atomic(SNAPSHOT_FILE, {"version": version, "generated": generated, "stations": stations},
+                          sort_keys=True, separators=(",", ":"))
+        write_json_atomic(DELTA_FILE, {"version": version, "deltas": deltas[-MAX_DELTAS:]},
+                          sort_keys=True, separators=(",", ":"))
+        print(f"Status feed version {version}: {len(changed)} changed, {len(removed)} removed.")
+        return version
+    except Exception as e:
+        print(f"Warning: Could not publish status feed: {e}")
+        return None
@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from atomic_io import write_json_atomic
+from station_state import last_sample
+from stations import registry
+
+# Station status history + rolling availability.
+#
+# Every status run (check_api_status.py, check_ntrip_ports.py, update_status.py)
+# appends one row per station to status_history; rows older than the longest
+# period are deleted in the same transaction, so the DB stays bounded. Availability for the last
+# 24h / 7d / 30d is kept per station, per port and per 'Cluster Name':
+#   uptime_buckets: hourly (online, total) sample counts per scope/key
+#   uptime_rollups: running (online, total) per scope/key/period
+# Each run adds its samples to the rollups and subtracts only the buckets that
+# just fell out of each period, so nothing is recomputed from full history.
+#
+# station_uptime.json (percentages) is exported for the web map. The DB itself
+# isn't committed; the workflow keeps it between runs with actions/cache.
+
+# Configuration
+HISTORY_DB = os.environ.get("STATUS_HISTORY_DB", "Data/status_history.sqlite")
+UPTIME_FILE = "app/data/station_uptime.json"
+
+# Rolling periods (name, hours)
+PERIODS = [("24h", 24), ("7d", 7 * 24), ("30d", 30 * 24)]
+SCOPES = ["station", "port", "cluster"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS status_history (
+    ts INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    code TEXT NOT NULL,
+    port INTEGER,
+    cluster TEXT,
+    online INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_status_history_code_ts ON status_history (code, ts);
+CREATE INDEX IF NOT EXISTS idx_status_history_ts ON status_history (ts);
+
+CREATE TABLE IF NOT EXISTS uptime_buckets (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    online INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (scope, key, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS uptime_rollups (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    period TEXT NOT NULL,
+    online INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    expired_through INTEGER NOT NULL, -- buckets with hour <= this are already subtracted
+    PRIMARY KEY (scope, key, period)
+) WITHOUT ROWID;
+"""
+
+def load_clusters():
+    """{code: 'Cluster Name'} from the station GeoJSONs."""
+    return registry().clusters()
+
+class StatusHistory:
+    def __init__(self, path=HISTORY_DB, clusters=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.clusters = load_clusters() if clusters is None else clusters
+
+    def record_run(self, meta, source, ts=None):
+        """Appends one row per station and rolls the availability windows forward (one transaction)."""
+        ts = int(ts if ts is not None else time.time())
+        hour = ts // 3600
+
+        rows = []
+        samples = {} # (scope, key) -> [online, total]
+        for code, data in meta.items():
+            online = 1 if last_sample(data) else 0 # raw sample, not the hysteresis status
+            port = data.get('port')
+            cluster = self.clusters.get(code)
+            rows.append((ts, source, code, port, cluster, online))
+
+            for scope, key in (("station", code), ("port", port), ("cluster", cluster)):
+                if key is None:
+                    continue
+                counts = samples.setdefault((scope, str(key)), [0, 0])
+                counts[0] += online
+                counts[1] += 1
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO status_history (ts, source, code, port, cluster, online) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+            # 1. New samples into this hour's bucket and into every period's running total
+            self.conn.executemany("""
+                INSERT INTO uptime_buckets (scope, key, hour, online, total) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (scope, key, hour) DO UPDATE SET
+                    online = online + excluded.online, total = total + excluded.total
+            """, [(scope, key, hour, on, total) for (scope, key), (on, total) in samples.items()])
+
+            for period, hours in PERIODS:
+                cutoff = hour - hours
+                self.conn.executemany("""
+                    INSERT INTO uptime_rollups (scope, key, period, online, total, expired_through)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (scope, key, period) DO UPDATE SET
+                        online = online + excluded.online, total = total + excluded.total
+                """, [(scope, key, period, on, total, cutoff) for (scope, key), (on, total) in samples.items()])
+
+                # 2. Subtract only the buckets that left the window since the last run
+                self.conn.execute("""
+                    UPDATE uptime_rollups SET
+                        online = online - COALESCE((SELECT SUM(b.online) FROM uptime_buckets b
+                            WHERE b.scope = uptime_rollups.scope AND b.key = uptime_rollups.key
+                              AND b.hour > uptime_rollups.expired_through AND b.hour <= :cutoff), 0),
+                        total = total - COALESCE((SELECT SUM(b.total) FROM uptime_buckets b
+                            WHERE b.scope = uptime_rollups.scope AND b.key = uptime_rollups.key
+                              AND b.hour > uptime_rollups.expired_through AND b.hour <= :cutoff), 0),
+                        expired_through = :cutoff
+                    WHERE period = :period AND expired_through < :cutoff
+                """, {'cutoff': cutoff, 'period': period})
+
+            # 3. Raw rows and buckets older than the longest period are no longer needed
+            self.conn.execute("DELETE FROM status_history WHERE ts <= ?", (ts - PERIODS[-1][1] * 3600,))
+            self.conn.execute("DELETE FROM uptime_buckets WHERE hour <= ?", (hour - PERIODS[-1][1],))
+            self.conn.execute("DELETE FROM uptime_rollups WHERE total <= 0")
+
+        return len(rows)
+
+    def availability(self, scope):
+        """{key: {period: percent online (or None)}} for one scope."""
+        result = {}
+        for key, period, online, total in self.conn.execute(
+                "SELECT key, period, online, total FROM uptime_rollups WHERE scope = ?", (scope,)):
+            result.setdefault(key, {})[period] = round(100.0 * online / total, 2) if total else None
+        return result
+
+    def export_summary(self, path=UPTIME_FILE):
+        """Writes the precomputed availability summary for the web map (temp file + rename)."""
+        summary = {
+            "generated": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "periods": [name for name, _ in PERIODS],
+        }
+        for scope in SCOPES:
+            summary[scope + "s"] = self.availability(scope)
+
+        write_json_atomic(path, summary, sort_keys=True, separators=(",", ":"))
+
+    def close(self):
+        self.conn.close()
+
+def update_history(meta, source):
+    """Records a run and refreshes station_uptime.json. Never fails the calling script."""
+    try:
+        history = StatusHistory()
+        try:
+            count = history.record_run(meta, source)
+            history.export_summary()
+        finally:
+            history.close()
+        print(f"Status history: recorded {count} stations ({source}), uptime summary saved to {UPTIME_FILE}")
+    except Exception as e:
+        print(f"Warning: Could not update status history: {e}")
+
+if __name__ == "__main__":
+    # Print the current rollups
+    history = StatusHistory()
+    for scope in SCOPES:
+        print(f"\n{scope.upper()} AVAILABILITY (%)")
+        for key, periods in sorted(history.availability(scope).items()):
+            print(f"{key}: " + ", ".join(f"{name} {periods.get(name)}" for name, _ in PERIODS))
+    history.close()
@@ -0,0 +1,171 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import check_api_status
+import check_ntrip_ports
+import check_station_health
+from atomic_io import write_atomic, write_json_atomic
+from networks import load_networks, station_networks
+from station_state import apply_sample
+from status_feed import publish_status_feed
+from status_history import update_history
+
+# Single entry point for the status update.
+# Runs the three sources concurrently, merges them into one in-memory model and
+# writes each output file once (temp file + rename):
+#   1. SBC API status         (check_api_status.py)
+#   2. Sourcetable port scan  (check_ntrip_ports.py)
+#   3. RTCM health probe      (check_station_health.py)
+# Every network in networks.json is covered by each source (its own caster,
+# API client and limits), so one slow or broken network only loses its own data.
+# Wall-clock is roughly the slowest source instead of the sum of all three.
+#
+# Merge precedence:
+#   - Station list + ports: sourcetable scan (previous meta if the scan found nothing)
+#   - "Online":             API (connected AND receivingData) > sourcetable > previous status,
+#                           filtered through the hysteresis state machine (station_state.py)
+#   - Data/tracking fields: health probe (only for stations it reached)
+# Fields owned by other scripts (stream, api_details, ...) are carried over untouched.
+#
+# The health probe starts at the same time as the other two, so it schedules
+# (probe_scheduler.py) from the previous station_meta.json.
+#
+# Run: python update_status.py   (HEALTH_ENABLED=0 skips the RTCM probe)
+
+# Configuration
+META_FILE = "app/data/station_meta.json"
+MAPPING_FILE = check_ntrip_ports.OUTPUT_FILE
+QA_FILE = "app/data/QA_Port_Assignments.txt"
+HEALTH_ENABLED = os.environ.get("HEALTH_ENABLED", "1") == "1"
+
+def run_api_status(networks):
+    """Returns {CODE: site} from every network's API, or None if no API is available."""
+    api_map = check_api_status.fetch_api_maps(networks)
+    if api_map is not None:
+        print(f"[api] Retrieved {len(api_map)} sites.")
+    return api_map
+
+def run_port_scan(networks):
+    """Returns (mapping, active_streams, station_networks), or None if no streams were found on any port."""
+    mapping, active_streams, total, stream_networks = check_ntrip_ports.scan_active_streams(networks)
+    if total == 0:
+        print("[scan] No streams found on any port.")
+        return None
+    print(f"[scan] {total} streams, {len(active_streams)} stations active.")
+    return mapping, active_streams, stream_networks
+
+def run_health_probe(previous_meta, networks):
+    """Returns ({code: (is_active, details)}, {code: arp}) for the stations the scheduler says are due."""
+    targets = check_station_health.select_targets(previous_meta)
+    results = {}
+    arps = {}
+
+    def on_result(code, is_active, count, details):
+        results[code] = (is_active, details)
+        if details.get('arp'):
+            arps[code] = details['arp']
+
+    print(f"[health] Probing {len(targets)} stations...")
+    skipped = check_station_health.probe_all(targets, on_result,
+                                             networks=station_networks(previous_meta, networks))
+    if skipped:
+        print(f"[health] Not checked (deadline): {', '.join(skipped)}")
+    return results, arps
+
+def run_source(name, fn, *args):
+    """Runs one source; a failing source is logged and treated as 'no data'."""
+    start = time.monotonic()
+    try:
+        result = fn(*args)
+    except Exception as e:
+        print(f"[{name}] FAILED: {e}")
+        result = None
+    return result, time.monotonic() - start
+
+def merge(previous_meta, api_map, scan, health, current_time, networks=None):
+    """Builds the new station_meta from the three sources (see precedence above)."""
+    # 1. Station list + ports
+    if scan is not None:
+        mapping, active_streams, stream_networks = scan
+        scanned = check_ntrip_ports.build_station_meta(previous_meta, mapping, active_streams, current_time,
+                                                       stream_networks, networks)
+    else:
+        active_streams = set()
+        scanned = {code: {k: data.get(k) for k in check_ntrip_ports.SCAN_FIELDS} for code, data in previous_meta.items()}
+    meta = check_ntrip_ports.merge_scan(previous_meta, scanned)
+
+    # 2. Status: API where it knows the site, otherwise the scan's (or previous) status
+    for code, data in meta.items():
+        site = api_map.get(code) if api_map else None
+        if site is not None:
+            is_online = bool(check_api_status.is_api_online(site))
+        elif scan is not None:
+            is_online = code in active_streams
+        else:
+            continue
+        apply_sample(data, is_online, current_time)
+
+    # 3. Health probe fields
+    if health is not None:
+        results, arps = health
+        for code, (is_active, details) in results.items():
+            check_station_health.apply_probe_result(meta, code, is_active, details)
+        if arps:
+            check_station_health.apply_arp_checks(meta, arps)
+
+    return meta
+
+def main():
+    start = time.monotonic()
+    previous_meta = check_api_status.load_meta()
+    networks = load_networks()
+    print(f"Loaded {len(previous_meta)} stations from {META_FILE}, networks: "
+          f"{', '.join(n.name for n in networks)}. Running sources in parallel...")
+    caster_networks = [n for n in networks if n.has_caster]
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        api_future = pool.submit(run_source, "api", run_api_status, networks)
+        scan_future = pool.submit(run_source, "scan", run_port_scan, caster_networks)
+        health_future = (pool.submit(run_source, "health", run_health_probe, previous_meta, caster_networks)
+                         if HEALTH_ENABLED else None)
+
+        api_map, api_time = api_future.result()
+        scan, scan_time = scan_future.result()
+        health, health_time = health_future.result() if health_future else (None, 0)
+
+    print(f"Sources: api {api_time:.1f}s, scan {scan_time:.1f}s, health {health_time:.1f}s")
+
+    # FAIL-SAFE: without the API or the scan we can't say anything about status
+    if api_map is None and scan is None:
+        print("CRITICAL: API and sourcetable scan both failed. ABORTING UPDATE to preserve existing map data.")
+        exit(1)
+
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+    meta = merge(previous_meta, api_map, scan, health, current_time, networks)
+
+    # One write per output file
+    write_json_atomic(META_FILE, meta, indent=4, sort_keys=True)
+    publish_status_feed(meta)
+    update_history(meta, "pipeline")
+
+    if scan is not None:
+        clean_mapping = {k: v['port'] for k, v in meta.items() if v.get('port') is not None}
+        write_json_atomic(MAPPING_FILE, clean_mapping, indent=4, sort_keys=True)
+
+    sources = [name for name, result in (("SBC API", api_map), ("Sourcetable", scan), ("RTCM probe", health))
+               if result is not None]
+    report_lines = check_api_status.build_qa_report(meta, [
+        f"QA STATION STATUS REPORT ({current_time})",
+        f"Source: {', '.join(sources)}",
+    ])
+    write_atomic(QA_FILE, "\n".join(report_lines + check_station_health.latency_report_lines(meta)))
+
+    online = sum(1 for d in meta.values() if d.get('status') == 'Online')
+    print(f"Done in {time.monotonic() - start:.1f}s. {online}/{len(meta)} stations Online.")
+    print(f"Saved {META_FILE}, {QA_FILE}" + (f", {MAPPING_FILE}" if scan is not None else ""))
+
+if __name__ == "__main__":
+    main()